@@ -0,0 +1,107 @@
+# batch.py
+# ---------------
+# Licensing Information:  You are free to use or extend this projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to the University of Illinois at Urbana-Champaign
+
+"""
+This file contains a batch query API for many shortest path queries on one
+maze. Instead of one search per (start, goal) pair, a BFS distance field is
+computed once per source cell and kept in an LRU store, and every query
+sharing that source is answered by walking down the field.
+"""
+
+from collections import OrderedDict
+
+from search import astar_single_target
+
+class BatchPlanner:
+    """
+    answers shortest path queries on `maze`, keeping the distance fields of at most `maxsize`
+    source cells. Maze moves are symmetric, so a field from either end of a query answers it;
+    `query()` builds fields from whichever of the starts or goals has fewer distinct cells.
+    Fields are dropped when the maze is edited through `set_navigable()`. Building a field is 
+    preprocessing, as in `maze.distances_from`, and does not count towards `states_explored`.
+    Requires `compact`, otherwise every query falls back to `astar_single_target`.
+    """
+    def __init__(self, maze, maxsize = 64):
+        self.maze       = maze
+        self.maxsize    = maxsize
+        self.fields     = OrderedDict()
+        self.revision   = maze.revision
+
+    def field(self, cell):
+        """Returns the array of distances from `cell` to every cell, indexed like `maze.index()` (requires `compact`)"""
+        if self.revision != self.maze.revision:
+            self.fields.clear()
+            self.revision = self.maze.revision
+        if cell in self.fields:
+            self.fields.move_to_end(cell)
+            return self.fields[cell]
+
+        field = self.fields[cell] = self.maze.distances_from( * cell )
+        if len(self.fields) > self.maxsize:
+            self.fields.popitem(last = False)
+        return field
+
+    def source(self, start, goal, from_goal = True):
+        """Returns the endpoint whose field answers (start, goal), preferring one already stored"""
+        if goal in self.fields or start in self.fields:
+            return goal if goal in self.fields else start
+        return goal if from_goal else start
+
+    def distance(self, start, goal):
+        """Returns the maze distance from `start` to `goal`, or None if unreachable"""
+        if start == goal:
+            return 0
+        if not self.maze.compact:
+            path = astar_single_target(self.maze, start, goal)
+            return None if path is None else len(path) - 1
+        source  = self.source(start, goal)
+        target  = goal if source == start else start
+        cost    = self.field(source)[self.maze.index( * target )]
+        return None if cost == -1 else cost
+
+    def path(self, start, goal, from_goal = True):
+        """Returns the shortest path from `start` to `goal` as a list of (row, col) tuples, or None if unreachable"""
+        maze = self.maze
+        if not maze.compact:
+            return astar_single_target(maze, start, goal)
+
+        source  = self.source(start, goal, from_goal)
+        target  = goal if source == start else start
+        field   = self.field(source)
+        curr    = maze.index( * target )
+        if field[curr] == -1:
+            return None
+
+        # step to any neighbor one closer to the source until the source is reached
+        path = [curr]
+        while field[curr]:
+            for step in maze._index_moves[maze._moves[curr]]:
+                if field[curr + step] == field[curr] - 1:
+                    curr += step
+                    break
+            path.append(curr)
+        if source != goal:
+            path.reverse()
+        return [maze.cell(index) for index in path]
+
+    def query(self, pairs):
+        """
+        Answers a batch of (start, goal) queries, returning paths in the same order. Queries are
+        grouped by source cell, so each field is built once even when there are more distinct
+        sources than the store holds.
+        """
+        pairs       = list(pairs)
+        from_goal   = len({goal for _, goal in pairs}) <= len({start for start, _ in pairs})
+        paths       = [None] * len(pairs)
+        for x in sorted(range(len(pairs)), key = lambda x: pairs[x][1 if from_goal else 0]):
+            paths[x] = self.path( * pairs[x], from_goal = from_goal)
+        return paths
+
+    def paths(self, starts, goals):
+        """Answers every query from `starts` to `goals`, returning a dict of paths keyed by (start, goal)"""
+        pairs = [(start, goal) for start in starts for goal in goals]
+        return dict(zip(pairs, self.query(pairs)))
@@ -0,0 +1,159 @@
+# benchmark.py
+# ---------------
+# Licensing Information:  You are free to use or extend this projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to the University of Illinois at Urbana-Champaign
+
+"""
+This file contains a benchmark harness for the search functions. It generates
+random mazes of controllable size, wall density and waypoint count, times every
+applicable search method on them, and compares the results with a stored
+baseline so that slowdowns and extra expansions are flagged.
+"""
+
+import argparse, json, os, random, statistics, sys, tempfile, time
+
+from maze import Maze
+import search
+
+# methods that only look for the first waypoint, and methods that visit all of them
+SINGLE      = ('bfs', 'astar_single')
+MULTIPLE    = ('astar_multiple', 'fast')
+
+def generate_maze(path, rows, cols, density, waypoints, seed = 0):
+    """
+    Writes a `rows` by `cols` maze to `path` with a wall border, interior cells walled with
+    probability `density`, and one start and `waypoints` waypoints placed in the region
+    reachable from the start, so the maze is always solvable.
+    """
+    rng     = random.Random(seed)
+    grid    = [['%' if i in (0, rows - 1) or j in (0, cols - 1) or rng.random() < density else ' '
+        for j in range(cols)] for i in range(rows)]
+    free    = [(i, j) for i in range(rows) for j in range(cols) if grid[i][j] == ' ']
+    if not free:
+        raise ValueError('density {0} leaves no free cells in a {1}x{2} maze'.format(density, rows, cols))
+
+    # flood fill from a random start, and keep the largest region found over a few tries
+    region = []
+    for _ in range(8):
+        start   = rng.choice(free)
+        seen    = {start}
+        stack   = [start]
+        while stack:
+            i, j = stack.pop()
+            for x in ((i + 1, j), (i - 1, j), (i, j + 1), (i, j - 1)):
+                if grid[x[0]][x[1]] == ' ' and x not in seen:
+                    seen.add(x)
+                    stack.append(x)
+        if len(seen) > len(region):
+            region = sorted(seen)
+    if len(region) < waypoints + 1:
+        raise ValueError('no region of the maze is large enough for {0} waypoints'.format(waypoints))
+
+    cells = rng.sample(region, waypoints + 1)
+    grid[cells[0][0]][cells[0][1]] = 'P'
+    for i, j in cells[1:]:
+        grid[i][j] = '.'
+    with open(path, 'w') as file:
+        file.write('\n'.join(''.join(row) for row in grid) + '\n')
+
+def run_case(path, method, repeat):
+    times = []
+    for _ in range(repeat):
+        # waypoint distances are cached per file, which would hide their cost after the first run
+        search.DISTANCE_CACHE.clear()
+        maze        = Maze(path)
+        time_start  = time.perf_counter()
+        result      = getattr(search, method)(maze)
+        times.append(time.perf_counter() - time_start)
+    return {
+        'path length'       : len(result) if result else None,
+        'states explored'   : maze.states_explored,
+        'min time'          : min(times),
+        'median time'       : statistics.median(times),
+    }
+
+def run_suite(configs, methods, repeat, directory):
+    """
+    Runs every method that applies to each (rows, cols, density, waypoints, seed) config,
+    single-waypoint methods only on mazes with one waypoint, and returns results by case name.
+    """
+    results = {}
+    for rows, cols, density, waypoints, seed in configs:
+        name = '{0}x{1}-d{2}-w{3}-s{4}'.format(rows, cols, density, waypoints, seed)
+        path = os.path.join(directory, name)
+        generate_maze(path, rows, cols, density, waypoints, seed)
+        for method in methods:
+            if method in SINGLE and waypoints != 1:
+                continue
+            results['{0} {1}'.format(name, method)] = run_case(path, method, repeat)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Returns a list of messages for cases that got slower by more than `tolerance`, explore more states or changed path length"""
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        base = baseline[case]
+        if result['min time'] > base['min time'] * (1 + tolerance):
+            regressions.append('{0}: min time {1:.4f}s exceeds baseline {2:.4f}s by more than {3:.0%}'.format(
+                case, result['min time'], base['min time'], tolerance))
+        if result['states explored'] > base['states explored']:
+            regressions.append('{0}: explored {1} states, baseline explored {2}'.format(
+                case, result['states explored'], base['states explored']))
+        if result['path length'] != base['path length']:
+            regressions.append('{0}: path length {1}, baseline path length {2}'.format(
+                case, result['path length'], base['path length']))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description     = 'CS440 MP1 Search Benchmark',
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--sizes', dest = 'sizes', type = int, nargs = '+', default = [50, 100, 200],
+                        help = 'side lengths of the generated square mazes')
+    parser.add_argument('--densities', dest = 'densities', type = float, nargs = '+', default = [0.0, 0.2],
+                        help = 'fractions of interior cells that are walls')
+    parser.add_argument('--waypoints', dest = 'waypoints', type = int, nargs = '+', default = [1, 4, 8],
+                        help = 'waypoint counts of the generated mazes')
+    parser.add_argument('--seeds', dest = 'seeds', type = int, nargs = '+', default = [0],
+                        help = 'random seeds of the generated mazes')
+    parser.add_argument('--methods', dest = 'methods', type = str, nargs = '+', default = list(SINGLE + MULTIPLE),
+                        help = 'search methods to benchmark')
+    parser.add_argument('--repeat', dest = 'repeat', type = int, default = 3,
+                        help = 'timed runs per case, the fastest and the median are reported')
+    parser.add_argument('--baseline', dest = 'baseline', type = str, default = 'benchmark_baseline.json',
+                        help = 'baseline results file to compare against')
+    parser.add_argument('--save', default = False, action = 'store_true',
+                        help = 'store these results as the new baseline')
+    parser.add_argument('--tolerance', dest = 'tolerance', type = float, default = 0.2,
+                        help = 'allowed relative slowdown before a case is flagged')
+
+    arguments   = parser.parse_args()
+    configs     = [(size, size, density, waypoints, seed)
+        for size in arguments.sizes
+        for density in arguments.densities
+        for waypoints in arguments.waypoints
+        for seed in arguments.seeds]
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_suite(configs, arguments.methods, arguments.repeat, directory)
+
+    for case, result in results.items():
+        print('{0:40} path length {1:>6}  states explored {2:>9}  min {3:.4f}s  median {4:.4f}s'.format(
+            case, str(result['path length']), result['states explored'], result['min time'], result['median time']))
+
+    if arguments.save:
+        with open(arguments.baseline, 'w') as file:
+            json.dump(results, file, indent = 4)
+        print('saved baseline to {0}'.format(arguments.baseline))
+    elif os.path.exists(arguments.baseline):
+        with open(arguments.baseline) as file:
+            regressions = compare(results, json.load(file), arguments.tolerance)
+        for message in regressions:
+            print('REGRESSION {0}'.format(message))
+        if regressions:
+            sys.exit(1)
+        print('no regressions against {0}'.format(arguments.baseline))
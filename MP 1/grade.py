@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
-import pprint, argparse, pickle, json
+import pprint, argparse, pickle, json, hashlib, time, multiprocessing
+import multiprocessing.connection
 
 import maze 
 
@@ -32,6 +33,13 @@ if __name__ == "__main__":
 
     parser.add_argument('--gradescope', default = False, action = 'store_true',
                         help = 'save output in gradescope-readable json file')
+    parser.add_argument('--single', dest = 'single', type = str, default = None,
+                        choices = ('bfs', 'astar_single', 'bidirectional_bfs', 'jps'), 
+                        help = 'grade parts 1 and 2 with this single-waypoint search instead of bfs and astar_single')
+    parser.add_argument('--processes', dest = 'processes', type = int, default = None,
+                        help = 'worker processes to grade cases with (defaults to the number of cpus)')
+    parser.add_argument('--timeout', dest = 'timeout', type = float, default = 60,
+                        help = 'seconds each case may take before it is failed')
 
     arguments   = parser.parse_args()
     
@@ -46,109 +54,199 @@ if __name__ == "__main__":
             print(message)
         raise SystemExit
 
+def maze_hash(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+# instructor solutions are cached by maze content and solution, so regenerating a key 
+# only runs the search on mazes that were added or edited since the last run 
 def generate_answer_key(path, mazes, solutions):
-    key_instructor  = tuple({case: (getattr(search, solution)(maze), maze.states_explored)
+    try:
+        with open(path['cache'], 'rb') as file:
+            cache = pickle.load(file)
+    except FileNotFoundError:
+        cache = {}
+    
+    def solve(maze, solution):
+        index = (maze_hash(maze.path), solution)
+        if index not in cache:
+            cache[index] = (getattr(search, solution)(maze), maze.states_explored)
+        return cache[index]
+    
+    key_instructor  = tuple({case: solve(maze, solution)
         for case, maze in mazes.items()}
         for mazes, solution in zip(mazes, solutions))
     key_student     = tuple({case: (len(sol[0]), sol[1]) for case, sol in part.items()} 
         for part in key_instructor)
-    pickle.dump(key_instructor, open(path['instructor'], 'wb'))
-    pickle.dump(key_student,    open(path['student'],    'wb'))
+    for name, data in (('cache', cache), ('instructor', key_instructor), ('student', key_student)):
+        with open(path[name], 'wb') as file:
+            pickle.dump(data, file)
 
 def load_answer_key(path):
     try:
-        return pickle.load(open(path['instructor'], 'rb'))
+        with open(path['instructor'], 'rb') as file:
+            return pickle.load(file)
     except FileNotFoundError:
         print('running in student mode (instructor key unavailable)')
-        return pickle.load(open(path['student'],    'rb'))
-
-def grade_optimal(name, key, mazes, solution, weight = 1):
-    def grade(case, maze):
-        path, states_explored = key[case]
-        z = getattr(search, solution)(maze)
-        # check that the path is valid 
-        ret_valid = maze.validate_path(z)
-        score_validity  = int(ret_valid is None)
-        # check that the length of the student’s path matches 
-        true_len = (path if type(path) is int else len(path))
-        if score_validity:
-            score_length    = int(len(z) == true_len)
-            # check that student explores at most 10% more states than solution
-            score_explored = maze.states_explored < 1.1 * states_explored
-        else:
-            score_length = 0
-            score_explored = 0
-        return (
-            {
-                'name'      : '{0}: `validate_path(_:)` for \'{1}\' maze'.format(name, case),
-                'output'    : 'Your path is valid' if score_validity else "Your path is not valid, error: {}".format(ret_valid),
-                'score'     : 2 * weight * score_validity,
-                'max_score' : 2 * weight,
-                'visibility': 'visible'
-            },
-            {
-                'name'      : '{0}: not too many states explored for \'{1}\' maze'.format(name, case),
-                'output'    : 'You explored {} states, you should explore fewer than 1.1 * {}'.format(maze.states_explored, states_explored),
-                'score'     : weight * score_explored,
-                'max_score' : weight,
-                'visibility': 'visible'
-            },
-            {
-                'name'      : '{0}: correct path length for \'{1}\' maze'.format(name, case),
-                'output'    : 'Your path length is {}, the correct length is {}'.format(len(z), true_len),
-                'score'     : 2 * weight * score_length,
-                'max_score' : 2 * weight,
-                'visibility': 'visible'
-            },
-        )
-            
-    return tuple(item for case, maze in mazes.items() for item in grade(case, maze))
-
-def grade_suboptimal(name, key, mazes, solution):
-    def grade(case, maze):
-        path, states_explored = key[case]
-        z = getattr(search, solution)(maze)
-        # check that the path is valid 
-        ret_valid = maze.validate_path(z)
-        score_validity  = int(ret_valid is None)
-        # check that the path length isn't too bad 
-        sol_len = (path if type(path) is int else len(path))
-        if score_validity:
-            score_length    = ( len(z)  < 1.2 * sol_len )
-            
-            score_explored = maze.states_explored < 1.2 * states_explored
-        else:
-            score_length    = 0
-            score_explored = 0
-
-        return (
-            {
-                'name'      : '{0}: `validate_path(_:)` for \'{1}\' maze'.format(name, case),
-                'output'    : 'Your path is valid' if score_validity else "Your path is not valid, error: {}".format(ret_valid),
-                'score'     : 2 * score_validity,
-                'max_score' : 2,
-                'visibility': 'visible'
-            },
-            {
-                'name'      : '{0}: not too many states explored for \'{1}\' maze'.format(name, case),
-                'output'    : 'You explored {} states, you should explore fewer than 1.2 * {}'.format(maze.states_explored, states_explored),
-                'score'     : 4 * score_explored,
-                'max_score' : 4,
-                'visibility': 'visible'
-            },
-            {
-                'name'      : '{0}: correct path length for \'{1}\' maze'.format(name, case),
-                'output'    : 'Your path length is {}, it should be less than 1.2 * {}'.format(len(z), sol_len),
-                'score'     : 4 * score_length,
-                'max_score' : 4,
-                'visibility': 'visible'
-            },
-        )
-            
-    return tuple(item for case, maze in mazes.items() for item in grade(case, maze))
-
-def main():    
+        with open(path['student'], 'rb') as file:
+            return pickle.load(file)
+
+def score_optimal(name, case, maze, z, path, states_explored, weight = 1):
+    # check that the path is valid 
+    ret_valid = maze.validate_path(z)
+    score_validity  = int(ret_valid is None)
+    # check that the length of the student’s path matches 
+    true_len = (path if type(path) is int else len(path))
+    if score_validity:
+        score_length    = int(len(z) == true_len)
+        # check that student explores at most 10% more states than solution
+        score_explored = maze.states_explored < 1.1 * states_explored
+    else:
+        score_length = 0
+        score_explored = 0
+    return (
+        {
+            'name'      : '{0}: `validate_path(_:)` for \'{1}\' maze'.format(name, case),
+            'output'    : 'Your path is valid' if score_validity else "Your path is not valid, error: {}".format(ret_valid),
+            'score'     : 2 * weight * score_validity,
+            'max_score' : 2 * weight,
+            'visibility': 'visible'
+        },
+        {
+            'name'      : '{0}: not too many states explored for \'{1}\' maze'.format(name, case),
+            'output'    : 'You explored {} states, you should explore fewer than 1.1 * {}'.format(maze.states_explored, states_explored),
+            'score'     : weight * score_explored,
+            'max_score' : weight,
+            'visibility': 'visible'
+        },
+        {
+            'name'      : '{0}: correct path length for \'{1}\' maze'.format(name, case),
+            'output'    : 'Your path length is {}, the correct length is {}'.format(len(z), true_len),
+            'score'     : 2 * weight * score_length,
+            'max_score' : 2 * weight,
+            'visibility': 'visible'
+        },
+    )
+
+def score_suboptimal(name, case, maze, z, path, states_explored):
+    # check that the path is valid 
+    ret_valid = maze.validate_path(z)
+    score_validity  = int(ret_valid is None)
+    # check that the path length isn't too bad 
+    sol_len = (path if type(path) is int else len(path))
+    if score_validity:
+        score_length    = ( len(z)  < 1.2 * sol_len )
+        
+        score_explored = maze.states_explored < 1.2 * states_explored
+    else:
+        score_length    = 0
+        score_explored = 0
+
+    return (
+        {
+            'name'      : '{0}: `validate_path(_:)` for \'{1}\' maze'.format(name, case),
+            'output'    : 'Your path is valid' if score_validity else "Your path is not valid, error: {}".format(ret_valid),
+            'score'     : 2 * score_validity,
+            'max_score' : 2,
+            'visibility': 'visible'
+        },
+        {
+            'name'      : '{0}: not too many states explored for \'{1}\' maze'.format(name, case),
+            'output'    : 'You explored {} states, you should explore fewer than 1.2 * {}'.format(maze.states_explored, states_explored),
+            'score'     : 4 * score_explored,
+            'max_score' : 4,
+            'visibility': 'visible'
+        },
+        {
+            'name'      : '{0}: correct path length for \'{1}\' maze'.format(name, case),
+            'output'    : 'Your path length is {}, it should be less than 1.2 * {}'.format(len(z), sol_len),
+            'score'     : 4 * score_length,
+            'max_score' : 4,
+            'visibility': 'visible'
+        },
+    )
+
+# Runs the student search on one case and scores it, adding the search wall time to every 
+# score dict. Cases are sent to worker processes as plain data, so the maze is reloaded here.
+def grade_case(task):
+    import search 
+    scorer, name, case, filepath, solution, (path, states_explored), options = task 
+    case_maze   = maze.Maze(filepath)
+    time_start  = time.time()
+    z           = getattr(search, solution)(case_maze)
+    wall_time   = time.time() - time_start 
+    return tuple(dict(item, wall_time = wall_time) 
+        for item in scorer(name, case, case_maze, z, path, states_explored, ** options ))
+
+# scores a case the search never returned a path for, with `message` as the output of every item
+def failed_case(task, message):
+    scorer, name, case, filepath, solution, (path, states_explored), options = task 
+    return tuple(dict(item, output = message, wall_time = None) 
+        for item in scorer(name, case, maze.Maze(filepath), (), path, states_explored, ** options ))
+
+# worker side of run_cases: grades one case in its own process and sends the scores back
+def grade_worker(task, connection):
+    try:
+        connection.send(('scores', grade_case(task)))
+    except Exception as error:
+        connection.send(('error', repr(error)))
+    finally:
+        connection.close()
+
+# Grades cases serially, or each in its own process with at most `processes` running at once. 
+# A case that takes more than `timeout` seconds from when its process started is killed, 
+# so a hung search neither holds on to a worker nor eats into the time of the cases after it.
+def run_cases(tasks, processes = None, timeout = None):
+    if processes is None:
+        return tuple(item for task in tasks for item in grade_case(task))
+    
+    results = [None] * len(tasks)
+    waiting = list(enumerate(tasks))[::-1]
+    # receiving end of each running case's pipe -> (case index, process, deadline)
+    running = {}
+    while waiting or running:
+        while waiting and len(running) < processes:
+            index, task         = waiting.pop()
+            receiver, sender    = multiprocessing.Pipe(duplex = False)
+            process             = multiprocessing.Process(target = grade_worker, args = (task, sender), daemon = True)
+            process.start()
+            sender.close()
+            running[receiver]   = (index, process, None if timeout is None else time.monotonic() + timeout)
+
+        deadlines = [deadline for _, _, deadline in running.values() if deadline is not None]
+        wait = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+        for receiver in multiprocessing.connection.wait(list(running), wait):
+            index, process, _ = running.pop(receiver)
+            try:
+                kind, value = receiver.recv()
+            except EOFError:
+                kind, value = 'error', 'the grading process exited with code {0}'.format(process.exitcode)
+            receiver.close()
+            process.join()
+            results[index] = value if kind == 'scores' else failed_case(tasks[index], 'Your search raised {0}'.format(value))
+
+        now = time.monotonic()
+        for receiver, (index, process, deadline) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                process.kill()
+                process.join()
+                receiver.close()
+                del running[receiver]
+                results[index] = failed_case(tasks[index], 'Your search did not finish within {0} seconds'.format(timeout))
+    return tuple(item for result in results for item in result)
+
+def grade_optimal(name, key, mazes, solution, weight = 1, processes = None, timeout = None):
+    return run_cases(tuple((score_optimal, name, case, maze.path, solution, key[case], {'weight': weight}) 
+        for case, maze in mazes.items()), processes, timeout)
+
+def grade_suboptimal(name, key, mazes, solution, processes = None, timeout = None):
+    return run_cases(tuple((score_suboptimal, name, case, maze.path, solution, key[case], {}) 
+        for case, maze in mazes.items()), processes, timeout)
+
+def main(single = None, processes = None, timeout = None):    
     solutions = ('bfs', 'astar_single', 'astar_multiple', 'fast')
+    if single is not None:
+        solutions = (single, single) + solutions[2:]
     for solution in solutions:
         if not hasattr(search, solution):
             return fail('module \'search\' is missing expected member \'{0}\''.format(solution))
@@ -170,22 +268,26 @@ def main():
         #    for case in ('large',)},
     )
     
-    #generate_answer_key({'instructor': 'key_i', 'student': 'key_s'}, mazes, solutions)
+    #generate_answer_key({'instructor': 'key_i', 'student': 'key_s', 'cache': 'key_cache'}, mazes, solutions)
     key             = load_answer_key({'instructor': 'key_i', 'student': 'key_s'})
-    first_parts    = tuple(item for i, points in zip(range(0, 3), (1, 1, 1))
+    time_start      = time.time()
+    processes       = processes or multiprocessing.cpu_count()
+    first_parts     = tuple(item for i, points in zip(range(0, 3), (1, 1, 1))
         for item in grade_optimal('part-{0}'.format(i + 1), key[i], mazes[i], solutions[i], 
-            weight = points))
-    #last_part      = tuple(item for i in range(3, 4) for item in grade_suboptimal('part-{0}'.format(i + 1), key[i], mazes[i], solutions[i]))
+            weight = points, processes = processes, timeout = timeout))
+    #last_part       = tuple(item for i in range(3, 4) for item in grade_suboptimal('part-{0}'.format(i + 1), key[i], mazes[i], solutions[i], 
+    #    processes = processes, timeout = timeout))
     
     # construct grade dictionary for gradescope 
     return {
         'visibility': 'visible', 
+        'execution_time': time.time() - time_start, 
         'tests': first_parts
         #'tests': first_parts + last_part
     } 
     
 if __name__ == "__main__":
-    results     = main()
+    results     = main(arguments.single, arguments.processes, arguments.timeout)
     if arguments.gradescope:
         with open('results.json', 'w') as file:
             file.write(json.dumps(results))
@@ -11,16 +11,19 @@
 """
 This file contains the main application that is run for this MP. It
 initializes the pygame context, and handles the interface between the
-game and the search algorithm.
+game and the search algorithm. With --batch it instead solves every maze
+in a directory headlessly, without importing pygame.
 """
 
-import sys, argparse, time
+import sys, argparse, time, os, csv, json
+from concurrent.futures import ProcessPoolExecutor
 
-import pygame
-
-from maze import Maze
+from maze import Maze, MazeError
+from instrument import Instrumentation
 import search
 
+SEARCH_METHODS = ('bfs', 'astar_corner', 'astar_single', 'fast', 'astar_multiple', 'bidirectional_bfs', 'jps')
+
 class gradient:
     def __init__(self, start, end):
         # rgb colors
@@ -59,7 +62,11 @@ class Application:
         else:
             self.gradient = gradient((255, 0, 0), (0, 255, 0))
 
-    def run(self, filepath, mode, save):
+    def run(self, filepath, mode, save, stats = None):
+        # only imported once something is actually rendered, see `run_batch` for headless runs
+        global pygame 
+        import pygame 
+
         self.maze   = Maze(filepath)
         
         self.window = tuple(x * self.scale for x in self.maze.size)
@@ -73,7 +80,12 @@ class Application:
             #time in seconds
             time_start      = time.time()
             
-            path            = getattr(search, mode)(self.maze)
+            if stats is None:
+                path        = getattr(search, mode)(self.maze)
+            else:
+                with Instrumentation(search, self.maze, memory = True) as instrumentation:
+                    path    = getattr(search, mode)(self.maze)
+                instrumentation.to_json(stats)
             states_explored = self.maze.states_explored
             
             time_total      = time.time() - time_start   
@@ -174,16 +186,81 @@ Results
         i, j = self.maze.start
         pygame.draw.rect(self.surface, (0, 0, 255), tuple(int(i * self.scale) for i in (j + 0.25, i + 0.25, 0.5, 0.5)), 0)
 
+# Solves one (maze file, search method) pair for `run_batch`
+def solve(task):
+    filepath, mode = task 
+    result = {
+        'maze'              : filepath, 
+        'method'            : mode, 
+        'path length'       : None, 
+        'states explored'   : None, 
+        'execution time'    : None, 
+        'error'             : None, 
+    }
+    try:
+        maze = Maze(filepath)
+    except (MazeError, ValueError, UnicodeDecodeError) as error:
+        result['error'] = str(error)
+        return result 
+
+    # a search that raises fails only its own row, not the whole batch 
+    time_start  = time.time()
+    try:
+        path    = getattr(search, mode)(maze)
+    except Exception as error:
+        result['error'] = '{0}: {1}'.format(type(error).__name__, error)
+        return result 
+    result['execution time']    = time.time() - time_start 
+    result['states explored']   = maze.states_explored 
+    if path:
+        result['path length']   = len(path)
+        result['error']         = maze.validate_path(path)
+    else:
+        result['error']         = 'no path found'
+    return result 
+
+def run_batch(directory, modes, output, processes = None):
+    """
+    Runs every search method in `modes` on every maze file in `directory` across a process 
+    pool, without opening a window, and writes one row per (maze, method) to `output` as 
+    JSON if it ends in '.json' and as CSV otherwise.
+    """
+    tasks = [(os.path.join(directory, name), mode) 
+        for name in sorted(os.listdir(directory)) if os.path.isfile(os.path.join(directory, name)) 
+        for mode in modes]
+    with ProcessPoolExecutor(processes) as executor:
+        results = list(executor.map(solve, tasks))
+    
+    with open(output, 'w', newline = '') as file:
+        if output.endswith('.json'):
+            json.dump(results, file, indent = 4)
+        else:
+            writer = csv.DictWriter(file, fieldnames = tuple(results[0]) if results else ('maze', 'method'))
+            writer.writeheader()
+            writer.writerows(results)
+    return results 
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description     = 'CS440 MP1 Search', 
         formatter_class = argparse.ArgumentDefaultsHelpFormatter)
 
     parser.add_argument('path',
-                        help = 'path to maze file')
+                        help = 'path to maze file, or to a directory of maze files with --batch')
     parser.add_argument('--search', dest = 'search', type = str, default = 'bfs',
-                        choices = ('bfs', 'astar_corner', 'astar_single', 'fast', 'astar_multiple'), 
+                        choices = SEARCH_METHODS, 
                         help = 'search method')
+    parser.add_argument('--stats', dest = 'stats', type = str, default = None,
+                        help = 'save search instrumentation (expansions, frontier, memory, timings) to json file')
+    parser.add_argument('--batch', default = False, action = 'store_true',
+                        help = 'headlessly solve every maze in the directory `path`')
+    parser.add_argument('--methods', dest = 'methods', type = str, nargs = '+', default = None,
+                        choices = SEARCH_METHODS, 
+                        help = 'search methods to run in batch mode (defaults to --search)')
+    parser.add_argument('--processes', dest = 'processes', type = int, default = None,
+                        help = 'worker processes for batch mode (defaults to the number of cpus)')
+    parser.add_argument('--output', dest = 'output', type = str, default = 'results.csv',
+                        help = 'batch mode results file, written as json if it ends in .json and csv otherwise')
     parser.add_argument('--scale',  dest = 'scale', type = int, default = 20,
                         help = 'display scale')
     parser.add_argument('--fps',    dest = 'fps', type = int, default = 30,
@@ -196,8 +273,15 @@ if __name__ == "__main__":
                         help = 'view in an alternate color scheme')
 
     arguments   = parser.parse_args()
+    if arguments.batch:
+        results = run_batch(arguments.path, arguments.methods or [arguments.search], 
+            arguments.output, arguments.processes)
+        print('solved {0} (maze, method) pairs, results saved to {1}'.format(len(results), arguments.output))
+        raise SystemExit
+
     application = Application(arguments.human, arguments.scale, arguments.fps, arguments.altcolor)
     application.run(
         filepath    = arguments.path, 
         mode        = arguments.search, 
-        save        = arguments.save)
+        save        = arguments.save, 
+        stats       = arguments.stats)
@@ -8,17 +8,75 @@
 # Created by Kelvin Ma (kelvinm2@illinois.edu) on 01/24/2021, 
 # Inspired by previous work by Michael Abir (abir2@illinois.edu) and Rahul Kunji (rahulsk2@illinois.edu)
 
-from collections import namedtuple
+from collections import namedtuple, deque
+from array import array
 from itertools import chain 
+import mmap, os, struct
+
+# offsets of the four moves, in the order `neighbors()` has always returned them
+_OFFSETS    = ((1, 0), (-1, 0), (0, 1), (0, -1))
+# every subset of `_OFFSETS`, indexed by a 4-bit mask of navigable directions
+_MOVES      = tuple(tuple(offset for bit, offset in enumerate(_OFFSETS) if mask >> bit & 1) 
+    for mask in range(1 << len(_OFFSETS)))
+
+# maps wall flags to free flags for `move_masks`
+_FREE       = bytes((1, )) + bytes(255)
+
+# binary maze cache written next to the maze file: this header, then the waypoints as 
+# (row, col) uint32 pairs, the maze characters, and the compact walls and move masks
+CACHE_SUFFIX    = '.cache'
+_CACHE_MAGIC    = b'MAZE\x00\x00\x00\x01'
+_CACHE_HEADER   = struct.Struct('<8sQq3s5I')
 
 class MazeError(Exception):
     pass
 
+def move_mask(walls, m, n, i, j):
+    """Returns the 4-bit mask of `_OFFSETS` that lead from (i, j) to a non-wall cell of an m by n grid"""
+    k = i * m + j
+    return (
+        (i + 1 <  n and not walls[k + m])       | 
+        (i - 1 >= 0 and not walls[k - m]) << 1  | 
+        (j + 1 <  m and not walls[k + 1]) << 2  | 
+        (j - 1 >= 0 and not walls[k - 1]) << 3)
+
+def move_masks(walls, m):
+    """
+    Returns `move_mask` of every cell of a grid with m columns whose borders are walls, 
+    computed all at once by shifting one big integer holding a byte per cell.
+    """
+    size    = len(walls)
+    free    = int.from_bytes(walls.translate(_FREE), 'little')
+    masks   = (free >> 8 * m | (free << 8 * m) << 1 | (free >> 8) << 2 | (free << 8) << 3) & ((1 << 8 * size) - 1)
+    return bytearray(masks.to_bytes(size, 'little'))
+
+def distance_field(moves, steps, source):
+    """
+    Returns an array of BFS distances from flat cell index `source` to every cell, or -1 
+    where unreachable, given a compact maze's per-cell move masks and `steps` table. 
+    Kept at module level so it can be shipped to worker processes.
+    """
+    distances = array('i', [-1]) * len(moves)
+    distances[source] = 0
+    queue = deque((source,))
+    while queue:
+        curr = queue.popleft()
+        cost = distances[curr] + 1
+        for step in steps[moves[curr]]:
+            if distances[curr + step] == -1:
+                distances[curr + step] = cost 
+                queue.append(curr + step)
+    return distances
+
 class Maze:
     """
     creates a maze instance given a `path` to a file containing characters in `legend`. 
+    if `compact` is set, walls are also packed into a flat bytearray and the navigable 
+    moves out of every cell are precomputed, which makes `navigable()` and `neighbors()` 
+    table lookups instead of repeated bounds checks. if `cache` is set, the parsed maze is 
+    stored in a binary file next to `path` and reloaded from there while `path` is unchanged.
     """
-    def __init__(self, path, legend = {'wall': '%', 'start': 'P', 'waypoint': '.'}):
+    def __init__(self, path, legend = {'wall': '%', 'start': 'P', 'waypoint': '.'}, compact = True, cache = False):
 
         # Passed in legend cannot introduce anything new
         for key in 'wall', 'start', 'waypoint':
@@ -31,52 +89,163 @@ class Maze:
             legend['start'], 
             legend['waypoint'])
         
-        with open(path) as file:
-            lines = tuple(line.strip() for line in file.readlines() if line)
+        self.path       = path 
+        self.compact    = compact 
+        if not (cache and self._load_cache(path)):
+            self._load_text(path)
+            if cache:
+                self._save_cache(path)
+        # number of `set_navigable()` edits since the maze was loaded from `path`
+        self.revision = 0
         
+        # there is no point in making this private since anyone trying to cheat 
+        # could simply overwrite the underscored variable
+        self.states_explored    = 0
+    
+    def _load_text(self, path):
+        """
+        Reads an ASCII maze through a memory map, validating it and collecting the start and 
+        waypoints in a single pass over its rows, straight into the compact representation.
+        """
+        wall, start, waypoint = (c.encode('latin-1') for c in self.legend)
+        rows, starts, waypoints = [], [], []
+        with open(path, 'rb') as file:
+            # an empty file cannot be mapped
+            data = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size else b''
+            try:
+                begin = 0
+                while begin < len(data):
+                    end = data.find(b'\n', begin)
+                    end = len(data) if end == -1 else end 
+                    row = data[begin : end].strip()
+                    for char, cells in ((start, starts), (waypoint, waypoints)):
+                        j = row.find(char)
+                        while j != -1:
+                            cells.append((len(rows), j))
+                            j = row.find(char, j + 1)
+                    rows.append(row)
+                    begin = end + 1
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+        if not rows:
+            raise MazeError('(maze \'{0}\'): maze file is empty'.format(path))
+
         # Stores copy of ASCII maze in self._storage as well as dimensions in self.size.x/y
-        n = len(lines)
-        m = min(map(len, lines))
+        n = len(rows)
+        m = min(map(len, rows))
         
-        if any(len(line) != m for line in lines):
+        if any(len(row) != m for row in rows):
             raise MazeError('(maze \'{0}\'): all maze rows must be the same length (shortest row has length {1})'.format(path, m))
         
-        self._storage   = lines 
+        self._storage   = tuple(row.decode('latin-1') for row in rows)
         self.size       = namedtuple('size', ('x', 'y'))(m, n)
         
-        if any(self[x] != self.legend.wall for x in chain(
-            ((    0, j) for j in range(m)), 
-            ((n - 1, j) for j in range(m)), 
-            ((i,     0) for i in range(n)), 
-            ((i, m - 1) for i in range(n)))):
+        if rows[0].count(wall) != m or rows[-1].count(wall) != m or any(
+            row[:1] != wall or row[-1:] != wall for row in rows):
             raise MazeError('(maze \'{0}\'): maze borders must only contain `wall` cells (\'{1}\')'.format(path, self.legend.wall))
         if n < 3 or m < 3:
             raise MazeError('(maze \'{0}\'): maze dimensions ({1}, {2}) must be at least (3, 3)'.format(path, n, m))
         
         # Checks if only 1 start, if so, stores index in self.start
-        self.start  = None 
-        for x in ((i, j) 
-            for i in range(self.size.y) 
-            for j in range(self.size.x) if self[i, j] == self.legend.start):
-            if self.start is None:
-                self.start = x
-            elif type(self.start) is int:
-                self.start += 1 
-            else: 
-                self.start  = 2
-        if type(self.start) is int or self.start is None:
+        if len(starts) != 1:
             raise MazeError('(maze \'{0}\'): maze must contain exactly one `start` cell (\'{1}\') (found {2})'.format(
-                path, self.legend.start, 0 if self.start is None else self.start))
-        
+                path, self.legend.start, len(starts)))
+        self.start      = starts[0]
         # Stores waypoint indices in self.waypoints
-        self.waypoints = tuple((i, j) 
-            for i in range(self.size.y) 
-            for j in range(self.size.x) if self[i, j] == self.legend.waypoint)
+        self.waypoints  = tuple(waypoints)
         
-        # there is no point in making this private since anyone trying to cheat 
-        # could simply overwrite the underscored variable
-        self.states_explored    = 0
-    
+        if self.compact:
+            table = bytearray(256)
+            table[wall[0]] = 1
+            self._build_compact(bytearray(b''.join(rows).translate(table)))
+
+    def _save_cache(self, path):
+        """Writes the parsed maze next to `path` in the binary format read by `_load_cache`"""
+        source  = os.stat(path)
+        m, n    = self.size.x, self.size.y
+        header  = _CACHE_HEADER.pack(_CACHE_MAGIC, source.st_size, source.st_mtime_ns, 
+            ''.join(self.legend).encode('latin-1'), n, m, self.start[0], self.start[1], len(self.waypoints))
+        if self.compact:
+            walls, moves = self._walls, self._moves 
+        else:
+            walls = moves = b''
+        try:
+            with open(path + CACHE_SUFFIX + '.tmp', 'wb') as file:
+                file.write(header)
+                file.write(struct.pack('<{0}I'.format(2 * len(self.waypoints)), * chain.from_iterable(self.waypoints)))
+                file.write(''.join(self._storage).encode('latin-1'))
+                file.write(walls)
+                file.write(moves)
+            os.replace(path + CACHE_SUFFIX + '.tmp', path + CACHE_SUFFIX)
+        except OSError:
+            # caching is best-effort, e.g. the maze directory may be read-only
+            pass
+
+    def _load_cache(self, path):
+        """Loads the binary cache of `path`, returning False if it is missing or out of date"""
+        try:
+            source = os.stat(path)
+            with open(path + CACHE_SUFFIX, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return False
+        if len(data) < _CACHE_HEADER.size:
+            return False
+        magic, size, mtime, legend, n, m, si, sj, k = _CACHE_HEADER.unpack_from(data)
+        if (magic, size, mtime, legend) != (_CACHE_MAGIC, source.st_size, source.st_mtime_ns, ''.join(self.legend).encode('latin-1')):
+            return False
+        
+        # a truncated or partly written cache falls back to the text; compact caches also hold 
+        # walls and move masks, which only a compact maze needs
+        offset  = _CACHE_HEADER.size
+        grid    = offset + 8 * k + n * m
+        if len(data) != grid + 2 * n * m and (self.compact or len(data) != grid):
+            return False
+        points  = struct.unpack_from('<{0}I'.format(2 * k), data, offset)
+        offset += 8 * k
+        cells   = data[offset : offset + n * m].decode('latin-1')
+        offset += n * m
+
+        self._storage   = tuple(cells[i * m : (i + 1) * m] for i in range(n))
+        self.size       = namedtuple('size', ('x', 'y'))(m, n)
+        self.start      = (si, sj)
+        self.waypoints  = tuple(zip(points[0::2], points[1::2]))
+        if self.compact:
+            self._build_compact(bytearray(data[offset : offset + n * m]), bytearray(data[offset + n * m :]))
+        return True
+
+    def _build_compact(self, walls, moves = None):
+        """Keeps `walls` in self._walls and a mask of navigable moves per cell in self._moves"""
+        m = self.size.x
+        if moves is None:
+            moves = move_masks(walls, m)
+        self._width = m 
+        self._walls = walls 
+        self._moves = moves 
+        # the same moves as steps between flat cell indices, see `index_neighbors()`
+        self._index_moves = tuple(tuple(di * m + dj for di, dj in offsets) for offsets in _MOVES)
+
+    def set_navigable(self, i, j, navigable):
+        """
+        Turns cell (i, j) into an empty cell if `navigable` is set and into a wall otherwise, 
+        keeping the compact tables in sync. Border, start and waypoint cells cannot be changed.
+        """
+        if not (0 < i < self.size.y - 1 and 0 < j < self.size.x - 1):
+            raise MazeError('cell ({0}, {1}) is on or outside the maze border'.format(i, j))
+        if (i, j) == self.start or (i, j) in self.waypoints:
+            raise MazeError('cell ({0}, {1}) is the start or a waypoint'.format(i, j))
+
+        self.revision += 1
+        char = ' ' if navigable else self.legend.wall 
+        row  = self._storage[i]
+        self._storage = self._storage[:i] + (row[:j] + char + row[j + 1:],) + self._storage[i + 1:]
+        if self.compact:
+            m, n = self.size.x, self.size.y
+            self._walls[i * m + j] = not navigable 
+            for di, dj in ((0, 0), ) + _OFFSETS:
+                self._moves[(i + di) * m + j + dj] = move_mask(self._walls, m, n, i + di, j + dj)
+
     def __getitem__(self, index):
         """Access data at index via self[index] instead of using self._storage"""
         i, j = index
@@ -93,6 +262,8 @@ class Maze:
     
     def navigable(self, i, j):
         """Check if moving to (i,j) is a valid move"""
+        if self.compact:
+            return 0 <= i < self.size.y and 0 <= j < self.size.x and not self._walls[i * self._width + j]
         try:
             return self[i, j] != self.legend.wall 
         except IndexError:
@@ -101,6 +272,8 @@ class Maze:
     def neighbors(self, i, j):
         """Returns list of neighboing squares that can be moved to from the given row,col"""
         self.states_explored += 1 
+        if self.compact:
+            return tuple([(i + di, j + dj) for di, dj in _MOVES[self._moves[i * self._width + j]]])
         return tuple(x for x in (
             (i + 1, j),
             (i - 1, j),
@@ -108,6 +281,27 @@ class Maze:
             (i, j - 1)) 
             if self.navigable( * x ))
 
+    def index(self, i, j):
+        """Returns the flat index i * size.x + j of cell (i, j)"""
+        return i * self.size.x + j 
+    
+    def cell(self, index):
+        """Returns the (i, j) cell at flat `index`, the inverse of `index()`"""
+        return divmod(index, self.size.x)
+    
+    def index_neighbors(self, index):
+        """Like `neighbors()`, but takes and returns flat cell indices (requires `compact`)"""
+        self.states_explored += 1 
+        return tuple([index + step for step in self._index_moves[self._moves[index]]])
+
+    def distances_from(self, i, j):
+        """
+        Returns an array, indexed like `index()`, of true maze distances from (i, j) to 
+        every cell (-1 if unreachable). This is preprocessing, so it does not count 
+        towards `states_explored`. Requires `compact`.
+        """
+        return distance_field(self._moves, self._index_moves, self.index(i, j))
+
     def validate_path(self, path):
         # validate type and shape 
         if len(path) == 0:
@@ -119,10 +313,10 @@ class Maze:
         path = tuple(map(tuple, path))
 
         # check if path is contiguous
-        for i, (a, b) in enumerate(zip(path, path[1:])):
-            if sum(abs(b - a) for a, b in zip(a, b)) != 1:
+        for i, ((ai, aj), (bi, bj)) in enumerate(zip(path, path[1:])):
+            if abs(bi - ai) + abs(bj - aj) != 1:
                 return 'path vertex {1} ({4}, {5}) must be exactly one move away from path vertex {0} ({2}, {3})'.format(
-                    i, i + 1, * a , * b )
+                    i, i + 1, ai, aj, bi, bj)
 
         # check if path is navigable 
         for i, x in enumerate(path):
@@ -130,21 +324,44 @@ class Maze:
                 return 'path vertex {0} ({1}, {2}) is not a navigable maze cell'.format(i, * x )
         
         # check if path ends at a waypoint 
-        for waypoint in self.waypoints:
-            if path[-1] == waypoint:
-                break 
-        else:
+        waypoints = set(self.waypoints)
+        if path[-1] not in waypoints:
             return 'last path vertex {0} ({1}, {2}) must be a waypoint'.format(len(path) - 1, * path[-1] )
 
-        # check for unnecessary path segments
+        # check for unnecessary path segments, using the number of waypoint vertices before 
+        # each index so that a segment is checked in constant time instead of rescanned
         indices = {}
+        visited = 0
         for i, x in enumerate(path):
-            if x in indices:
-                if all(self[x] != self.legend.waypoint for x in path[indices[x] : i]):
-                    return 'path segment [{0} : {1}] contains no waypoints'.format(indices[x], i)
-            indices[x] = i 
+            if x in indices and indices[x][1] == visited:
+                return 'path segment [{0} : {1}] contains no waypoints'.format(indices[x][0], i)
+            indices[x] = (i, visited)
+            visited += x in waypoints
         
         # check if path contains all waypoints 
         for i, x in enumerate(self.waypoints):
             if x not in indices:
                 return 'waypoint {0} ({1}, {2}) was never visited'.format(i, * x )
+
+if __name__ == '__main__':
+    import tempfile
+
+    # sanity check that a truncated cache is ignored and the maze is read from its text again
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'maze')
+        with open(path, 'w') as file:
+            file.write('%%%%%%\n%P  .%\n% .  %\n%%%%%%\n')
+        expected = Maze(path)
+        for compact in (True, False):
+            Maze(path, compact = compact, cache = True)
+            with open(path + CACHE_SUFFIX, 'rb') as file:
+                data = file.read()
+            for length in range(len(data)):
+                with open(path + CACHE_SUFFIX, 'wb') as file:
+                    file.write(data[:length])
+                maze = Maze(path, compact = compact, cache = True)
+                result = (maze._storage, maze.start, maze.waypoints)
+                assert result == (expected._storage, expected.start, expected.waypoints), \
+                    f'Maze(path, compact = {compact}) with a cache truncated to {length} bytes reads {result}'
+
+    print('Maze tests passed')
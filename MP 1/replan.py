@@ -0,0 +1,112 @@
+# replan.py
+# ---------------
+# Licensing Information:  You are free to use or extend this projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to the University of Illinois at Urbana-Champaign
+
+"""
+This file contains an incremental planner for mazes that are edited between
+queries. It implements Lifelong Planning A* (LPA*): distances from the start
+are kept between queries, and after walls are toggled only the cells whose
+distance actually changed are expanded again.
+"""
+
+import heapq
+
+from search import manhat_dst
+
+INFINITY = float('inf')
+
+class IncrementalPlanner:
+    """
+    plans shortest paths from `start` (defaults to `maze.start`) to `goal` (defaults to the
+    first waypoint) on `maze`. Edit the maze through `set_wall()`/`set_free()` and move the
+    goal with `set_goal()`, then call `plan()` to get the updated path.
+    """
+    def __init__(self, maze, start = None, goal = None):
+        self.maze   = maze
+        self.start  = maze.start if start is None else start
+        self.goal   = maze.waypoints[0] if goal is None else goal
+
+        # g is the settled distance from the start, rhs the one-step lookahead distance
+        self.g      = {}
+        self.rhs    = {self.start: 0}
+        self.heap   = []
+        # current key of every queued cell, heap entries with any other key are stale
+        self.queued = {}
+        self.push(self.start)
+
+    def key(self, cell):
+        cost = min(self.g.get(cell, INFINITY), self.rhs.get(cell, INFINITY))
+        return (cost + manhat_dst(cell, self.goal), cost)
+
+    def push(self, cell):
+        key = self.key(cell)
+        self.queued[cell] = key
+        heapq.heappush(self.heap, (key, cell))
+
+    def top(self):
+        while self.heap and self.queued.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0] if self.heap else ((INFINITY, INFINITY), None)
+
+    # moves out of `cell`, without counting towards `states_explored`
+    def adjacent(self, cell):
+        i, j = cell
+        return tuple(x for x in ((i + 1, j), (i - 1, j), (i, j + 1), (i, j - 1)) if self.maze.navigable( * x ))
+
+    def update(self, cell):
+        if cell != self.start:
+            if self.maze.navigable( * cell ):
+                self.rhs[cell] = min((self.g.get(x, INFINITY) + 1 for x in self.adjacent(cell)), default = INFINITY)
+            else:
+                self.rhs[cell] = INFINITY
+        self.queued.pop(cell, None)
+        if self.g.get(cell, INFINITY) != self.rhs.get(cell, INFINITY):
+            self.push(cell)
+
+    def set_navigable(self, i, j, navigable):
+        self.maze.set_navigable(i, j, navigable)
+        for cell in ((i, j), ) + self.adjacent((i, j)):
+            self.update(cell)
+
+    def set_wall(self, i, j):
+        self.set_navigable(i, j, False)
+
+    def set_free(self, i, j):
+        self.set_navigable(i, j, True)
+
+    def set_goal(self, goal):
+        """Moves the goal; distances from the start stay valid, so only queue keys are recomputed"""
+        self.goal   = goal
+        self.queued = {cell: self.key(cell) for cell in self.queued}
+        self.heap   = [(key, cell) for cell, key in self.queued.items()]
+        heapq.heapify(self.heap)
+
+    def plan(self):
+        """
+        Brings distances up to date for the current maze and returns the shortest path from the
+        start to the goal as a list of (row, col) tuples, or None if the goal is unreachable.
+        """
+        g, rhs = self.g, self.rhs
+        while self.top()[0] < self.key(self.goal) or rhs.get(self.goal, INFINITY) != g.get(self.goal, INFINITY):
+            key, cell = heapq.heappop(self.heap)
+            del self.queued[cell]
+            self.maze.states_explored += 1
+            if g.get(cell, INFINITY) > rhs.get(cell, INFINITY):
+                g[cell] = rhs[cell]
+                for x in self.adjacent(cell):
+                    self.update(x)
+            else:
+                g[cell] = INFINITY
+                for x in self.adjacent(cell) + (cell, ):
+                    self.update(x)
+
+        if g.get(self.goal, INFINITY) == INFINITY:
+            return None
+        path = [self.goal]
+        while path[-1] != self.start:
+            path.append(min(self.adjacent(path[-1]), key = lambda x: g.get(x, INFINITY)))
+        path.reverse()
+        return path
@@ -1,7 +1,14 @@
 
-from collections import deque
+from collections import deque, OrderedDict
 from typing import List
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import heapq
+import os
+import time
+
+from maze import distance_field
 # search.py
 # ---------------
 # Licensing Information:  You are free to use or extend this projects for
@@ -27,14 +34,16 @@ files and classes when code is run, so be careful to not modify anything else.
 # Initialize it with a list/tuple of objectives
 # Call compute_mst_weight to get the weight of the MST with those objectives
 # TODO: hint, you probably want to cache the MST value for sets of objectives you've already computed...
+# Pass `distances`, a dict of true maze distances keyed by (i, j) objective pairs such as 
+# the one built by `waypoint_distances`, to weigh edges exactly instead of by manhattan distance
 class MST:
-    def __init__(self, objectives):
+    def __init__(self, objectives, distances = None):
         self.elements = {key: None for key in objectives}
 
         # TODO: implement some distance between two objectives 
         # ... either compute the shortest path between them, or just use the manhattan distance between the objectives
         self.distances   = {
-                (i, j): manhat_dst(i, j)
+                (i, j): manhat_dst(i, j) if distances is None else distances[(i, j)]
                 for i, j in self.cross(objectives)
             }
         
@@ -72,6 +81,81 @@ class MST:
     def cross(self, keys):
         return (x for y in (((i, j) for j in keys if i < j) for i in keys) for x in y)
 
+# cache of `waypoint_distances` results, keyed by maze file, modification time and waypoints. 
+# Every entry holds a distance field per waypoint, so only the most recently used mazes are kept.
+DISTANCE_CACHE      = OrderedDict()
+DISTANCE_CACHE_SIZE = 4
+
+def waypoint_distances(maze, processes = None):
+    """
+    Runs one BFS per waypoint of a compact maze to get true maze distances. Like 
+    `maze.distances_from`, this is preprocessing and does not count towards `states_explored`.
+
+    @param maze: The maze to precompute distances on.
+    @param processes: Number of worker processes to spread the BFS runs over, or None to run them serially.
+
+    @return (pairs, fields): pairs maps every (waypoint, waypoint) pair to its maze distance, 
+        and fields maps every waypoint to an array of distances to all cells, indexed by `maze.index`
+    """
+    # an edited maze no longer matches its file, so it is never cached
+    key = (os.path.abspath(maze.path), os.stat(maze.path).st_mtime_ns, maze.waypoints) if not maze.revision else None
+    if key in DISTANCE_CACHE:
+        DISTANCE_CACHE.move_to_end(key)
+        return DISTANCE_CACHE[key]
+
+    sources = [maze.index( * waypoint ) for waypoint in maze.waypoints]
+    if processes is None:
+        arrays = [maze.distances_from( * waypoint ) for waypoint in maze.waypoints]
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            arrays = list(executor.map(distance_field, 
+                repeat(maze._moves), repeat(maze._index_moves), sources))
+
+    fields  = dict(zip(maze.waypoints, arrays))
+    pairs   = {(a, b): fields[a][index] for a in maze.waypoints for b, index in zip(maze.waypoints, sources)}
+    if key is not None:
+        DISTANCE_CACHE[key] = pairs, fields
+        if len(DISTANCE_CACHE) > DISTANCE_CACHE_SIZE:
+            DISTANCE_CACHE.popitem(last = False)
+    return pairs, fields
+
+class MSTCache:
+    """
+    MST weights of subsets of `waypoints`, keyed by a bitmask with bit i set when waypoints[i] 
+    is in the subset. Up to `TABLE_BITS` waypoints the weights live in a flat array of size 2^k, 
+    beyond that in an LRU dict holding at most `maxsize` subsets.
+    """
+    TABLE_BITS = 16
+
+    def __init__(self, waypoints, distances, maxsize = 1 << 16):
+        self.waypoints  = waypoints 
+        self.distances  = distances 
+        self.maxsize    = maxsize 
+        if len(waypoints) <= self.TABLE_BITS:
+            self.table  = array('i', [-1]) * (1 << len(waypoints))
+        else:
+            self.table  = None 
+            self.lru    = OrderedDict()
+
+    def weight(self, mask):
+        if self.table is not None:
+            weight = self.table[mask]
+            if weight == -1:
+                weight = self.table[mask] = self.compute(mask)
+            return weight 
+
+        if mask in self.lru:
+            self.lru.move_to_end(mask)
+            return self.lru[mask]
+        weight = self.lru[mask] = self.compute(mask)
+        if len(self.lru) > self.maxsize:
+            self.lru.popitem(last = False)
+        return weight 
+
+    def compute(self, mask):
+        return MST([waypoint for bit, waypoint in enumerate(self.waypoints) if mask >> bit & 1], 
+            self.distances).compute_mst_weight()
+
 class Node:
     def __init__(self, pos, waypoints, parent, cost):
         self.pos = pos
@@ -96,6 +180,8 @@ def bfs(maze):
 
     @return path: a list of tuples containing the coordinates of each state in the computed path
     """
+    if maze.compact:
+        return bfs_indexed(maze, maze.start, maze.waypoints[0])
     queue = deque()
     retPath = []
     visited = {
@@ -124,6 +210,230 @@ def bfs(maze):
 def manhat_dst(a, b):
     return abs(b[1] - a[1]) + abs(b[0] - a[0]) 
 
+# Integer-indexed search engine, used whenever the maze has its compact backend.
+# Cells are encoded as flat indices row * width + col, and costs and parents are kept 
+# in preallocated arrays instead of one `Node` per push, so an expanded state costs a 
+# few bytes and paths are rebuilt by walking the parent array.
+def trace_parents(maze, parents, index):
+    path = []
+    while index != -1:
+        path.append(maze.cell(index))
+        index = parents[index]
+    path.reverse()
+    return path
+
+def bfs_indexed(maze, startc, goal):
+    """
+    Runs BFS from `startc` to `goal` on the flat cell indices of a compact maze.
+
+    @return path: a list of tuples containing the coordinates of each state in the computed path
+    """
+    size    = maze.size.x * maze.size.y
+    parents = array('i', [-1]) * size
+    visited = bytearray(size)
+    start   = maze.index( * startc )
+    target  = maze.index( * goal )
+
+    visited[start] = 1
+    queue = deque((start,))
+    while queue:
+        curr = queue.popleft()
+        if curr == target:
+            return trace_parents(maze, parents, curr)
+
+        for neighbor in maze.index_neighbors(curr):
+            if not visited[neighbor]:
+                visited[neighbor] = 1
+                parents[neighbor] = curr
+                queue.append(neighbor)
+
+def astar_indexed(maze, startc, goal):
+    """
+    Runs A star from `startc` to `goal` on the flat cell indices of a compact maze.
+
+    @return path: a list of tuples containing the coordinates of each state in the computed path
+    """
+    width   = maze.size.x
+    size    = width * maze.size.y
+    costs   = array('i', [-1]) * size
+    parents = array('i', [-1]) * size
+    start   = maze.index( * startc )
+    target  = maze.index( * goal )
+
+    costs[start] = 0
+    heap = [(manhat_dst(startc, goal), 0, start)]
+    while heap:
+        _, cost, curr = heapq.heappop(heap)
+        if curr == target:
+            return trace_parents(maze, parents, curr)
+        # a cheaper route to this cell was pushed after this entry
+        if cost > costs[curr]:
+            continue
+
+        for neighbor in maze.index_neighbors(curr):
+            if costs[neighbor] == -1 or costs[neighbor] > cost + 1:
+                costs[neighbor]     = cost + 1
+                parents[neighbor]   = curr
+                heapq.heappush(heap, (cost + 1 + manhat_dst(divmod(neighbor, width), goal), cost + 1, neighbor))
+
+def waypoint_heuristic(cell, mask, fields, weights):
+    """
+    Returns the true distance from flat index `cell` to the nearest waypoint still in `mask`, 
+    plus the MST weight of those waypoints, given a distance field per waypoint and an `MSTCache`
+    """
+    if not mask:
+        return 0
+    nearest = min(field[cell] for bit, field in enumerate(fields) if mask >> bit & 1)
+    return nearest + weights.weight(mask)
+
+def waypoint_states(maze):
+    """
+    Sets up the (cell, remaining waypoints) state space of a compact maze. A state is packed 
+    into one integer, mask * size + cell, where bit i of mask is set while waypoints[i] is 
+    still unvisited. The heuristic is the true distance to the nearest remaining waypoint 
+    plus the MST weight of the remaining waypoints.
+
+    @return (size, bits, start, heuristic): the number of cells, the waypoint bit of every 
+        waypoint cell index, the packed start state and the heuristic(cell, mask) function
+    """
+    pairs, fields = waypoint_distances(maze)
+    size    = maze.size.x * maze.size.y
+    bits    = {maze.index( * waypoint ): 1 << bit for bit, waypoint in enumerate(maze.waypoints)}
+    fields  = [fields[waypoint] for waypoint in maze.waypoints]
+    weights = MSTCache(maze.waypoints, pairs)
+
+    # looked up by name on every call, so instrumentation can time it
+    def heuristic(cell, mask):
+        return waypoint_heuristic(cell, mask, fields, weights)
+
+    cell    = maze.index( * maze.start )
+    mask    = ((1 << len(maze.waypoints)) - 1) & ~bits.get(cell, 0)
+    return size, bits, mask * size + cell, heuristic 
+
+def trace_states(maze, parents, state, size):
+    path = []
+    while state != -1:
+        path.append(maze.cell(state % size))
+        state = parents[state]
+    path.reverse()
+    return path
+
+def astar_multiple_indexed(maze, weight = 1):
+    """
+    Runs A star over the packed (cell, remaining waypoints) states of `waypoint_states`, 
+    with the heuristic scaled by `weight` (1 keeps it optimal).
+
+    @return path: a list of tuples containing the coordinates of each state in the computed path
+    """
+    size, bits, start, heuristic = waypoint_states(maze)
+    costs   = {start: 0}
+    parents = {start: -1}
+    closed  = set()
+    heap    = [(weight * heuristic( * reversed(divmod(start, size)) ), 0, start)]
+    while heap:
+        _, cost, state = heapq.heappop(heap)
+        if state in closed:
+            continue
+        closed.add(state)
+
+        mask, cell = divmod(state, size)
+        if not mask:
+            return trace_states(maze, parents, state, size)
+
+        for neighbor in maze.index_neighbors(cell):
+            remaining   = mask & ~bits.get(neighbor, 0)
+            packed      = remaining * size + neighbor 
+            if packed not in closed and (packed not in costs or costs[packed] > cost + 1):
+                costs[packed]   = cost + 1
+                parents[packed] = state 
+                heapq.heappush(heap, (cost + 1 + weight * heuristic(neighbor, remaining), cost + 1, packed))
+
+def anytime_astar(maze, weights = (2, 1.5, 1.25, 1), deadline = None, expansions = None):
+    """
+    Runs anytime repairing A star (ARA*) over the packed states of `waypoint_states`. The first 
+    solution comes from the first, largest weight; each following weight reuses the earlier 
+    search effort to improve it. Improvement stops when `deadline` seconds have passed or 
+    `expansions` states have been explored since the call, but never before a first solution 
+    exists. With neither budget set only the first weight is searched.
+
+    @param maze: The maze to execute the search on.
+
+    @return (path, bound): a list of tuples containing the coordinates of each state in the 
+        best path found, and a factor by which that path is at most longer than optimal 
+        (1 means optimal); (None, inf) if there is no path
+    """
+    if deadline is None and expansions is None:
+        weights = weights[:1]
+    time_start  = time.perf_counter()
+    explored    = maze.states_explored
+    
+    def exhausted():
+        return ((deadline is not None and time.perf_counter() - time_start >= deadline) or 
+            (expansions is not None and maze.states_explored - explored >= expansions))
+
+    size, bits, start, heuristic = waypoint_states(maze)
+    # the start may already be the last waypoint, which no expansion would find
+    if start < size:
+        return [maze.start], 1
+    estimates   = {}
+    def estimate(state):
+        if state not in estimates:
+            mask, cell = divmod(state, size)
+            estimates[state] = heuristic(cell, mask)
+        return estimates[state]
+
+    costs       = {start: 0}
+    parents     = {start: -1}
+    # states to expand at the current weight, and states improved after being expanded at it
+    opened      = {start}
+    inconsistent = set()
+    best        = None
+    bound       = float('inf')
+    for weight in weights:
+        heap    = [(costs[state] + weight * estimate(state), costs[state], state) for state in opened]
+        heapq.heapify(heap)
+        closed  = set()
+        interrupted = False
+        while heap and (best is None or heap[0][0] < costs[best]):
+            if best is not None and exhausted():
+                interrupted = True
+                break
+            _, cost, state = heapq.heappop(heap)
+            if state not in opened or cost != costs[state]:
+                continue
+            opened.discard(state)
+            closed.add(state)
+
+            mask, cell = divmod(state, size)
+            for neighbor in maze.index_neighbors(cell):
+                remaining   = mask & ~bits.get(neighbor, 0)
+                packed      = remaining * size + neighbor 
+                if packed not in costs or costs[packed] > cost + 1:
+                    costs[packed]   = cost + 1
+                    parents[packed] = state 
+                    if not remaining:
+                        if best is None or cost + 1 < costs[best]:
+                            best = packed 
+                    elif packed in closed:
+                        inconsistent.add(packed)
+                    else:
+                        opened.add(packed)
+                        heapq.heappush(heap, (cost + 1 + weight * estimate(packed), cost + 1, packed))
+
+        if best is None:
+            return None, bound
+        # every cheaper solution would have to pass through an open or inconsistent state, 
+        # and a completed pass at `weight` also bounds the solution by `weight` 
+        frontier    = min((costs[state] + estimate(state) for state in opened | inconsistent), default = costs[best])
+        bound       = min(bound, costs[best] / frontier if frontier < costs[best] else 1)
+        if not interrupted:
+            bound   = min(bound, weight)
+        opened     |= inconsistent 
+        inconsistent = set()
+        if bound == 1 or exhausted():
+            break
+    return trace_states(maze, parents, best, size), bound 
+
 def astar_single(maze):
     """
     Runs A star for part 2 of the assignment.
@@ -132,6 +442,8 @@ def astar_single(maze):
 
     @return path: a list of tuples containing the coordinates of each state in the computed path
     """
+    if maze.compact:
+        return astar_indexed(maze, maze.start, maze.waypoints[0])
     heap = []
     retPath = []
     visited = {
@@ -158,6 +470,163 @@ def astar_single(maze):
                 heapq.heappush(heap, ((curr.cost + 1 + manhat_dst(neighbor, maze.waypoints[0])), Node(neighbor, maze.waypoints, curr, curr.cost + 1)))
 
 
+def bidirectional_bfs(maze):
+    """
+    Runs BFS from the start and from the waypoint at the same time, always growing the 
+    smaller frontier by one full layer, until the two searches meet.
+
+    @param maze: The maze to execute the search on.
+
+    @return path: a list of tuples containing the coordinates of each state in the computed path
+    """
+    start, goal = maze.start, maze.waypoints[0]
+    if start == goal:
+        return [start]
+    parents     = ({start: None}, {goal: None})
+    depths      = ({start: 0}, {goal: 0})
+    frontiers   = ([start], [goal])
+    while frontiers[0] and frontiers[1]:
+        side    = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        other   = 1 - side 
+        layer   = []
+        meeting = None
+        for curr in frontiers[side]:
+            for neighbor in maze.neighbors( * curr ):
+                if neighbor in depths[other]:
+                    length = depths[side][curr] + 1 + depths[other][neighbor]
+                    if meeting is None or length < meeting[0]:
+                        meeting = (length, curr, neighbor)
+                elif neighbor not in depths[side]:
+                    parents[side][neighbor] = curr 
+                    depths[side][neighbor]  = depths[side][curr] + 1
+                    layer.append(neighbor)
+        
+        # finish the whole layer before joining, so the shortest meeting point wins 
+        if meeting is not None:
+            _, curr, neighbor = meeting 
+            halves = [[], []]
+            for half, cell in ((side, curr), (other, neighbor)):
+                while cell is not None:
+                    halves[half].append(cell)
+                    cell = parents[half][cell]
+            halves[0].reverse()
+            return halves[0] + halves[1]
+        frontiers[side][:] = layer 
+
+def row_bits(maze, i, rows):
+    """Returns row i as an integer with bit k set where (i, k) is navigable, kept in `rows` by row"""
+    if i not in rows:
+        rows[i] = sum(1 << k for k in range(maze.size.x) if maze.navigable(i, k))
+    return rows[i]
+
+def row_jumps(maze, i, dj, goal, rows):
+    """
+    Returns row i as an integer with bit k set where a horizontal scan in direction dj stops at 
+    a jump point: the goal, or a cell where a vertical move becomes forced. Kept in `rows` by 
+    (row, direction).
+    """
+    if (i, dj) not in rows:
+        forced = 0
+        for dv in (1, -1):
+            side    = row_bits(maze, i + dv, rows)
+            forced |= side & ~(side << 1 if dj == 1 else side >> 1)
+        if goal[0] == i:
+            forced |= 1 << goal[1]
+        rows[i, dj] = forced & row_bits(maze, i, rows)
+    return rows[i, dj]
+
+def jump(maze, i, j, di, dj, goal, rows):
+    """
+    Moves from (i, j) by (di, dj) until reaching a jump point, which is returned, or a wall, 
+    in which case None is returned. Paths are kept canonical by taking vertical moves as 
+    early as possible, so a horizontal scan only stops where a vertical move becomes forced 
+    and a vertical scan stops wherever a horizontal scan would find a jump point. Every cell 
+    a scan passes counts as explored.
+
+    Horizontal scans are answered from per-row bit masks of navigable cells and jump points, 
+    kept in `rows`, so they take a few integer operations instead of a step per cell.
+    """
+    if dj:
+        walls, jumps = ~row_bits(maze, i, rows), row_jumps(maze, i, dj, goal, rows)
+        if dj == 1:
+            # lowest set bits above column j; the walls mask has bits set past the last column 
+            wall    = ((walls >> (j + 1)) & -(walls >> (j + 1))).bit_length() + j
+            ahead   = jumps >> (j + 1)
+            point   = (ahead & -ahead).bit_length() + j if ahead else None 
+        else:
+            # highest set bits below column j, column -1 counting as a wall 
+            wall    = (walls & ((1 << j) - 1)).bit_length() - 1
+            point   = (jumps & ((1 << j) - 1)).bit_length() - 1 if jumps & ((1 << j) - 1) else None 
+        if point is not None and (point - wall) * dj < 0:
+            maze.states_explored += (point - j) * dj 
+            return i, point 
+        maze.states_explored += (wall - j) * dj 
+        return None 
+    while True:
+        i += di 
+        maze.states_explored += 1 
+        if not maze.navigable(i, j):
+            return None 
+        if (i, j) == goal or jump(maze, i, j, 0, 1, goal, rows) or jump(maze, i, j, 0, -1, goal, rows):
+            return i, j 
+
+def jump_directions(maze, i, j, direction):
+    """Returns the directions to scan from jump point (i, j), reached by moving in `direction`"""
+    if direction is None:
+        return ((1, 0), (-1, 0), (0, 1), (0, -1))
+    di, dj = direction 
+    if di:
+        return ((di, 0), (0, 1), (0, -1))
+    return ((0, dj), ) + tuple((dv, 0) for dv in (1, -1) 
+        if maze.navigable(i + dv, j) and not maze.navigable(i + dv, j - dj))
+
+def jps(maze):
+    """
+    Runs jump point search, A star over jump points of the 4-connected grid, for a single 
+    waypoint. Each jump point expanded counts as one explored state, and so does every 
+    cell the scans between them look at.
+
+    @param maze: The maze to execute the search on.
+
+    @return path: a list of tuples containing the coordinates of each state in the computed path
+    """
+    goal    = maze.waypoints[0]
+    start   = (maze.start, None)
+    costs   = {start: 0}
+    parents = {start: None}
+    heap    = [(manhat_dst(maze.start, goal), 0, start)]
+    rows    = {}
+    while heap:
+        _, cost, state = heapq.heappop(heap)
+        if cost > costs[state]:
+            continue 
+        (i, j), direction = state 
+        if (i, j) == goal:
+            # fill in the straight segments between consecutive jump points
+            points = []
+            while state is not None:
+                points.append(state[0])
+                state = parents[state]
+            points.reverse()
+            path = [points[0]]
+            for a, b in zip(points, points[1:]):
+                di, dj = (b[0] > a[0]) - (b[0] < a[0]), (b[1] > a[1]) - (b[1] < a[1])
+                for step in range(1, manhat_dst(a, b) + 1):
+                    path.append((a[0] + di * step, a[1] + dj * step))
+            return path 
+
+        maze.states_explored += 1 
+        for di, dj in jump_directions(maze, i, j, direction):
+            point = jump(maze, i, j, di, dj, goal, rows)
+            if point is None:
+                continue 
+            successor   = (point, (di, dj))
+            length      = cost + manhat_dst((i, j), point)
+            if successor not in costs or costs[successor] > length:
+                costs[successor]    = length 
+                parents[successor]  = state 
+                heapq.heappush(heap, (length + manhat_dst(point, goal), length, successor))
+
 def astar_multiple(maze):
     """
     Runs A star for part 3 of the assignment in the case where there are
@@ -167,6 +636,8 @@ def astar_multiple(maze):
 
     @return path: a list of tuples containing the coordinates of each state in the computed path
     """
+    if maze.compact:
+        return astar_multiple_indexed(maze)
     WP_CACHE = {}
     MST_CACHE = {}
     heap = []
@@ -219,6 +690,8 @@ def astar_single_target(maze, startc, wp_close):
 
     @return path: a list of tuples containing the coordinates of each state in the computed path
     """
+    if maze.compact:
+        return astar_indexed(maze, startc, wp_close)
     heap = []
     retPath = []
     visited = {
@@ -244,14 +717,18 @@ def astar_single_target(maze, startc, wp_close):
                 visited[neighbor] = curr.cost + 1
                 heapq.heappush(heap, ((curr.cost + 1 + manhat_dst(neighbor, wp_close)), Node(neighbor, maze.waypoints, curr, curr.cost + 1)))
 
-def fast(maze):
+def fast(maze, deadline = None, expansions = None):
     """
-    Runs suboptimal search algorithm for part 4.
+    Runs suboptimal search algorithm for part 4. On compact mazes this is `anytime_astar`, 
+    which keeps improving the path until `deadline` seconds or `expansions` explored states 
+    are spent, and returns the first weighted A star path if neither is given.
 
     @param maze: The maze to execute the search on.
 
     @return path: a list of tuples containing the coordinates of each state in the computed path
     """
+    if maze.compact:
+        return anytime_astar(maze, deadline = deadline, expansions = expansions)[0]
     WP_CACHE = {}
     MST_CACHE = {}
     heap = []
@@ -294,4 +771,28 @@ def fast(maze):
                 if neighbor in WP_CACHE : 
                     WP_CACHE[neighbor].add(tuple(curr.wpremaining))
                 else:
-                    WP_CACHE[neighbor] = {tuple(curr.wpremaining)}
\ No newline at end of file
+                    WP_CACHE[neighbor] = {tuple(curr.wpremaining)}
+
+if __name__ == '__main__':
+    import tempfile
+    from maze import Maze
+
+    # sanity checks of edge cases every search must handle, on small mazes in a temporary directory
+    def sanity_maze(directory, rows):
+        path = os.path.join(directory, 'maze')
+        with open(path, 'w') as file:
+            file.write('\n'.join(rows) + '\n')
+        return Maze(path)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # the start is the only waypoint
+        maze = sanity_maze(directory, ('%%%%%%', '%P  .%', '%    %', '%%%%%%'))
+        maze.waypoints = (maze.start, )
+        result = anytime_astar(maze)
+        assert result == ([maze.start], 1), f'anytime_astar(maze) with the start as the only waypoint returns {result}, expected: {([maze.start], 1)}'
+        result = fast(maze)
+        assert result == [maze.start], f'fast(maze) with the start as the only waypoint returns {result}, expected: {[maze.start]}'
+        result = bidirectional_bfs(maze)
+        assert result == [maze.start], f'bidirectional_bfs(maze) with the start as the waypoint returns {result}, expected: {[maze.start]}'
+
+    print('Search tests passed')
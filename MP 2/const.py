@@ -27,6 +27,17 @@ START_CHAR = 'P'
 OBJECTIVE_CHAR = '.'
 SPACE_CHAR = ' '
 
+# codes of the cells of a maze's occupancy array, CELL_CHARS[code] is the character of a code
+SPACE_CELL = 0
+WALL_CELL = 1
+OBJECTIVE_CELL = 2
+START_CELL = 3
+UNKNOWN_CELL = 4
+CELL_CHARS = SPACE_CHAR + WALL_CHAR + OBJECTIVE_CHAR + START_CHAR + '?'
+
+# mazes saved to files with this suffix use the binary format instead of ASCII
+BINARY_MAZE_SUFFIX = '.mzb'
+
 ALPHA = 0
 BETA = 1
 GAMMA = 2
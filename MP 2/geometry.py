@@ -16,6 +16,10 @@ import math
 import numpy as np
 from alien import Alien
 
+#np.isclose(a, b) with its default tolerances, for scalars, without numpy's per-call overhead
+def isclose(a, b):
+    return abs(a - b) <= 1e-8 + 1e-5 * abs(b)
+
 #helper function to find distance from point (p1, p2) to line segment
 def dist(seg1x, seg1y, seg2x, seg2y, p1, p2):
     dist = (seg2x-seg1x)**2 + (seg2y-seg1y)**2
@@ -116,25 +120,145 @@ def doIntersect(p1,q1,p2,q2):
     # If none of the cases
     return False
 
+# Array-oriented counterparts of dist, orientation, onSegment and doIntersect. The kernels take
+# NumPy arrays (or scalars) that broadcast against each other and repeat the scalar functions'
+# arithmetic step by step, so results agree with them up to the last bit of rounding (Python's
+# float ** 2 and NumPy's square can differ there). The _array functions build whole matrices.
+
+# array version of dist: distance from points (p1, p2) to segments
+def segmentDist(seg1x, seg1y, seg2x, seg2y, p1, p2):
+    length = (seg2x-seg1x)**2 + (seg2y-seg1y)**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pointDist = np.clip(((p1 - seg1x) * (seg2x-seg1x) + (p2 - seg1y) * (seg2y-seg1y)) / np.asarray(length, dtype=float), 0, 1)
+    pointDist = np.where(length == 0, 0, pointDist)
+    dx = seg1x + pointDist * (seg2x-seg1x) - p1
+    dy = seg1y + pointDist * (seg2y-seg1y) - p2
+    return np.sqrt(dx**2 + dy**2)
+
+# array version of orientation
+def orientations(px, py, qx, qy, rx, ry):
+    return np.sign((np.asarray(qy - py, dtype=float) * (rx - qx)) - (np.asarray(qx - px, dtype=float) * (ry - qy)))
+
+# array version of onSegment
+def onSegments(px, py, qx, qy, rx, ry):
+    return (qx <= np.maximum(px, rx)) & (qx >= np.minimum(px, rx)) & (qy <= np.maximum(py, ry)) & (qy >= np.minimum(py, ry))
+
+# array version of doIntersect for segments (p1, q1) and (p2, q2)
+def segmentsIntersect(p1x, p1y, q1x, q1y, p2x, p2y, q2x, q2y):
+    o1 = orientations(p1x, p1y, q1x, q1y, p2x, p2y)
+    o2 = orientations(p1x, p1y, q1x, q1y, q2x, q2y)
+    o3 = orientations(p2x, p2y, q2x, q2y, p1x, p1y)
+    o4 = orientations(p2x, p2y, q2x, q2y, q1x, q1y)
+    return (((o1 != o2) & (o3 != o4)) |
+            ((o1 == 0) & onSegments(p1x, p1y, p2x, p2y, q1x, q1y)) |
+            ((o2 == 0) & onSegments(p1x, p1y, q2x, q2y, q1x, q1y)) |
+            ((o3 == 0) & onSegments(p2x, p2y, p1x, p1y, q2x, q2y)) |
+            ((o4 == 0) & onSegments(p2x, p2y, q1x, q1y, q2x, q2y)))
+
+def dist_array(segments, points):
+    """Distances from every point to every segment
+
+        Args:
+            segments (array_like): N segments as rows (startx, starty, endx, endy)
+            points (array_like): M points as rows (x, y)
+
+        Return:
+            (N, M) array of distances, entry [n, m] being dist(*segments[n], *points[m]) up to rounding
+    """
+    segments = np.asarray(segments, dtype=float).reshape(-1, 4).T[:, :, None]
+    points = np.asarray(points, dtype=float).reshape(-1, 2).T[:, None, :]
+    return segmentDist( * segments, * points)
+
+def doIntersect_array(segments1, segments2):
+    """Whether every segment of segments1 intersects every segment of segments2
+
+        Args:
+            segments1 (array_like): N segments as rows (startx, starty, endx, endy)
+            segments2 (array_like): M segments as rows (startx, starty, endx, endy)
+
+        Return:
+            (N, M) boolean array, entry [n, m] equal to doIntersect for segments1[n] and segments2[m]
+    """
+    segments1 = np.asarray(segments1, dtype=float).reshape(-1, 4).T[:, :, None]
+    segments2 = np.asarray(segments2, dtype=float).reshape(-1, 4).T[:, None, :]
+    return segmentsIntersect( * segments1, * segments2)
+
+class WallGrid:
+    """Uniform grid over wall segments, built once per map, so that collision
+    checks only test the walls whose bounding boxes are near the alien.
+
+        Iterating a WallGrid yields all of its walls, so it can be passed
+        anywhere a list of walls is expected.
+    """
+    def __init__(self, walls, cellSize=None):
+        """
+            Args:
+                walls (list): List of endpoints of line segments in the format [(startx, starty, endx, endy), ...]
+                cellSize (float): side length of a grid cell, defaults to the mean wall bounding box side
+        """
+        self.walls = list(walls)
+        self.boxes = [(min(w[0], w[2]), min(w[1], w[3]), max(w[0], w[2]), max(w[1], w[3])) for w in self.walls]
+        if cellSize is None:
+            sides = [max(box[2] - box[0], box[3] - box[1]) for box in self.boxes]
+            cellSize = max(1.0, sum(sides) / len(sides)) if sides else 1.0
+        self.cellSize = cellSize
+        self.cells = {}
+        for k, box in enumerate(self.boxes):
+            for cell in self.cellsOf(* box):
+                self.cells.setdefault(cell, []).append(k)
+
+    def __iter__(self):
+        return iter(self.walls)
+
+    def __len__(self):
+        return len(self.walls)
+
+    def cellsOf(self, x0, y0, x1, y1):
+        i0, j0 = math.floor(x0 / self.cellSize), math.floor(y0 / self.cellSize)
+        i1, j1 = math.floor(x1 / self.cellSize), math.floor(y1 / self.cellSize)
+        return ((i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1))
+
+    def query(self, x0, y0, x1, y1):
+        """Returns the walls whose bounding boxes overlap the box (x0, y0)-(x1, y1), in their original order"""
+        found = set()
+        for cell in self.cellsOf(x0, y0, x1, y1):
+            found.update(self.cells.get(cell, ()))
+        return [self.walls[k] for k in sorted(found)
+            if self.boxes[k][0] <= x1 and x0 <= self.boxes[k][2] and self.boxes[k][1] <= y1 and y0 <= self.boxes[k][3]]
+
+    def around(self, x0, y0, x1, y1, radius):
+        """Returns the walls that could be within `radius` of anything inside the box (x0, y0)-(x1, y1)"""
+        # widened slightly so that distances np.isclose to the radius are kept too
+        margin = radius + abs(radius) * 1e-5 + 1e-8
+        return self.query(x0 - margin, y0 - margin, x1 + margin, y1 + margin)
+
+    def near(self, alien, radius):
+        """Returns the walls that could be within `radius` of the alien's body"""
+        (headX, headY), (tailX, tailY) = alien.get_head_and_tail()
+        return self.around(min(headX, tailX), min(headY, tailY), max(headX, tailX), max(headY, tailY), radius)
+
 def does_alien_touch_wall(alien, walls,granularity):
     """Determine whether the alien touches a wall
 
         Args:
             alien (Alien): Instance of Alien class that will be navigating our map
-            walls (list): List of endpoints of line segments that comprise the walls in the maze in the format [(startx, starty, endx, endy), ...]
+            walls (list): List of endpoints of line segments that comprise the walls in the maze in the format [(startx, starty, endx, endy), ...],
+                or a WallGrid over them so only nearby walls are tested
             granularity (int): The granularity of the map
 
         Return:
             True if touched, False if not
     """
     tolerance = granularity/math.sqrt(2)
+    if isinstance(walls, WallGrid):
+        walls = walls.near(alien, alien.get_width() + tolerance)
 
     if alien.is_circle():
         for wall in walls:
             alienX = alien.get_centroid()[0]
             alienY = alien.get_centroid()[1]
             distance = dist(wall[0], wall[1], wall[2], wall[3], alienX, alienY)
-            if distance < alien.get_width() + tolerance or np.isclose(distance, alien.get_width() + tolerance):
+            if distance < alien.get_width() + tolerance or isclose(distance, alien.get_width() + tolerance):
                 return True
     else:
         for wall in walls:
@@ -145,13 +269,76 @@ def does_alien_touch_wall(alien, walls,granularity):
             d3 = dist(headX, headY, tailX, tailY, wall[0], wall[1])
             d4 = dist(headX, headY, tailX, tailY, wall[2], wall[3])
             minDist = min(d1, d2, d3, d4)
-            if minDist < alien.get_width() + tolerance or np.isclose(minDist, alien.get_width() + tolerance):
+            if minDist < alien.get_width() + tolerance or isclose(minDist, alien.get_width() + tolerance):
                 return True
             if doIntersect(Point(headX, headY), Point(tailX, tailY), Point(wall[0], wall[1]), Point(wall[2], wall[3])):
                 return True
     return False
 
 
+def does_alien_sweep_touch_wall(alien, config1, config2, walls):
+    """Determine whether the alien touches a wall anywhere on its way from config1 to config2
+
+        Between neighboring configurations the alien either moves in a straight line keeping
+        its shape, or changes shape in place. Moving, the body sweeps the parallelogram between
+        its head and tail at both ends, grown by its width: a capsule around the centroid's path
+        for the ball, a swept capsule for Horizontal and Vertical. Changing shape, it only takes
+        up its two bodies. There is no granularity tolerance, so a motion that passes is free of
+        collisions all the way, not just at its ends.
+
+        Args:
+            alien (Alien): Instance of Alien class, its configuration is restored before returning
+            config1 (tuple): (x, y, shape) configuration the motion starts at
+            config2 (tuple): (x, y, shape) configuration the motion ends at
+            walls (list): List of endpoints of line segments that comprise the walls in the maze in the format [(startx, starty, endx, endy), ...],
+                or a WallGrid over them so only nearby walls are tested
+
+        Return:
+            True if touched, False if not
+    """
+    config = alien.get_config()
+    bodies = []
+    for end in (config1, config2):
+        alien.set_alien_config(end)
+        bodies.append((alien.get_head_and_tail(), alien.get_width()))
+    alien.set_alien_config(config)
+
+    (head1, tail1), width1 = bodies[0]
+    (head2, tail2), width2 = bodies[1]
+    if config1[2] == config2[2]:
+        regions = [((head1, tail1, tail2, head2), width1)]
+    else:
+        regions = [((head1, tail1), width1), ((head2, tail2), width2)]
+
+    for corners, width in regions:
+        nearby = walls
+        if isinstance(walls, WallGrid):
+            nearby = walls.around(min(p[0] for p in corners), min(p[1] for p in corners),
+                max(p[0] for p in corners), max(p[1] for p in corners), width)
+        for wall in nearby:
+            if polygonTouches(corners, wall, width):
+                return True
+    return False
+
+# whether a wall comes within radius of the convex polygon with the given corners in order,
+# which may be degenerate: a segment, or a point
+def polygonTouches(corners, wall, radius):
+    edges = [(corners[n], corners[(n + 1) % len(corners)]) for n in range(len(corners))]
+    start, end = Point(wall[0], wall[1]), Point(wall[2], wall[3])
+    for p, q in edges:
+        if doIntersect(Point( * p ), Point( * q ), start, end):
+            return True
+
+    # a wall that crosses no edge is either entirely inside the polygon or entirely outside
+    turns = {orientation(Point( * p ), Point( * q ), start) for p, q in edges}
+    if len(turns) == 1 and 0 not in turns:
+        return True
+
+    minDist = min(min(dist( * p, * q, wall[0], wall[1]), dist( * p, * q, wall[2], wall[3])) for p, q in edges)
+    minDist = min([minDist] + [dist( * wall, * p ) for p in corners])
+    return minDist < radius or isclose(minDist, radius)
+
+
 def does_alien_touch_goal(alien, goals):
     """Determine whether the alien touches a goal
         
@@ -168,14 +355,14 @@ def does_alien_touch_goal(alien, goals):
             alienX = alien.get_centroid()[0]
             alienY = alien.get_centroid()[1]
             distance = math.sqrt((goal[0] - alienX)**2 + (goal[1] - alienY)**2)
-            if distance < alien.get_width() + goal[2] or np.isclose(distance, alien.get_width() + goal[2]):
+            if distance < alien.get_width() + goal[2] or isclose(distance, alien.get_width() + goal[2]):
                 return True
     else:
         for goal in goals:
             headX, headY = alien.get_head_and_tail()[0]
             tailX, tailY = alien.get_head_and_tail()[1]
             distance = dist(headX, headY, tailX, tailY, goal[0], goal[1])
-            if distance < alien.get_width() + goal[2] or np.isclose(distance, alien.get_width() + goal[2]):
+            if distance < alien.get_width() + goal[2] or isclose(distance, alien.get_width() + goal[2]):
                 return True
 
     return False
@@ -200,7 +387,7 @@ def is_alien_within_window(alien, window,granularity):
             alienX = alien.get_centroid()[0]
             alienY = alien.get_centroid()[1]
             distance = dist(wall[0], wall[1], wall[2], wall[3], alienX, alienY)
-            if distance < alien.get_width() + tolerance or np.isclose(distance, alien.get_width() + tolerance):
+            if distance < alien.get_width() + tolerance or isclose(distance, alien.get_width() + tolerance):
                 return False
     else:
         for wall in walls:
@@ -211,7 +398,7 @@ def is_alien_within_window(alien, window,granularity):
             d3 = dist(headX, headY, tailX, tailY, wall[0], wall[1])
             d4 = dist(headX, headY, tailX, tailY, wall[2], wall[3])
             minDist = min(d1, d2, d3, d4)
-            if minDist < alien.get_width() + tolerance or np.isclose(minDist, alien.get_width() + tolerance):
+            if minDist < alien.get_width() + tolerance or isclose(minDist, alien.get_width() + tolerance):
                 return False
             if doIntersect(Point(headX, headY), Point(tailX, tailY), Point(wall[0], wall[1]), Point(wall[2], wall[3])):
                 return False
@@ -0,0 +1,147 @@
+# instrument.py
+# ---------------
+# Licensing Information:  You are free to use or extend this projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to the University of Illinois at Urbana-Champaign
+
+"""
+This file contains instrumentation for the search functions. Nothing is
+measured unless a search runs inside an `Instrumentation` context: only then
+are the heap, frontier queue, neighbor and heuristic hooks of the search
+module and maze swapped for measuring versions, so uninstrumented runs pay no
+overhead at all.
+"""
+
+import heapq, json, time, tracemalloc
+from collections import deque
+
+class Instrumentation:
+    """
+    records metrics for searches from module `search` run on `maze` inside a `with` block:
+
+        expansions      : states explored (the change in `maze.states_explored`)
+        pushes, pops    : frontier operations, on heaps and on the `deque` used by BFS
+        stale pops      : popped entries that were skipped instead of expanded, i.e.
+                          duplicates and entries superseded by a cheaper one
+        peak frontier   : largest frontier size seen after a push
+        peak memory     : peak bytes allocated by Python, if `memory` is set
+        time            : seconds spent in heuristic functions (the module-level functions
+                          of `search` named in `heuristics`), neighbor generation, heap and
+                          queue operations, and in total
+    """
+    NEIGHBORS   = ('getNeighbors', )
+
+    def __init__(self, search, maze, memory = False, heuristics = ('heuristic', )):
+        self.search     = search
+        self.maze       = maze
+        self.memory     = memory
+        self.heuristics = tuple(name for name in heuristics if callable(getattr(search, name, None)))
+        self.counts     = {'expansions': 0, 'pushes': 0, 'pops': 0, 'stale pops': 0, 'peak frontier': 0, 'peak memory': None}
+        self.times      = {'heuristic': 0.0, 'neighbors': 0.0, 'frontier': 0.0, 'total': 0.0}
+        self.patched    = []
+
+    def __enter__(self):
+        self.explored   = self.maze.states_explored
+        # states_explored when the last entry was popped, to tell whether it got expanded
+        self.popped     = None
+
+        for name, function in (('heappush', self.heappush), ('heappop', self.heappop)):
+            if hasattr(self.search, name):
+                self.patch(self.search, name, function)
+        if hasattr(self.search, 'deque'):
+            self.patch(self.search, 'deque', self.frontier())
+        for name in self.heuristics:
+            self.patch(self.search, name, self.timed(getattr(self.search, name), 'heuristic'))
+        for name in self.NEIGHBORS:
+            if hasattr(self.maze, name):
+                self.patch(self.maze, name, self.timed(getattr(self.maze, name), 'neighbors'))
+
+        if self.memory:
+            tracemalloc.start()
+        self.start      = time.perf_counter()
+        return self
+
+    def __exit__(self, * exception ):
+        self.times['total'] += time.perf_counter() - self.start
+        if self.memory:
+            self.counts['peak memory'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.counts['expansions'] += self.maze.states_explored - self.explored
+        self.check_stale(None)
+
+        for owner, name, original in reversed(self.patched):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.patched = []
+        return False
+
+    # replaces `owner.name`; instance attributes that shadow a method are deleted on exit
+    def patch(self, owner, name, replacement):
+        self.patched.append((owner, name, vars(owner).get(name)))
+        setattr(owner, name, replacement)
+
+    def timed(self, function, phase):
+        def wrapper( * args , ** kwargs ):
+            start = time.perf_counter()
+            try:
+                return function( * args , ** kwargs )
+            finally:
+                self.times[phase] += time.perf_counter() - start
+        return wrapper
+
+    def pushed(self, size):
+        self.counts['pushes'] += 1
+        if size > self.counts['peak frontier']:
+            self.counts['peak frontier'] = size
+
+    def check_stale(self, explored):
+        if self.popped is not None and self.popped == self.maze.states_explored and explored is not None:
+            self.counts['stale pops'] += 1
+        self.popped = explored
+
+    def heappush(self, heap, item):
+        start = time.perf_counter()
+        heapq.heappush(heap, item)
+        self.times['frontier'] += time.perf_counter() - start
+        self.pushed(len(heap))
+
+    def heappop(self, heap):
+        self.check_stale(self.maze.states_explored)
+        start = time.perf_counter()
+        item = heapq.heappop(heap)
+        self.times['frontier'] += time.perf_counter() - start
+        self.counts['pops'] += 1
+        return item
+
+    # a `deque` subclass that reports to this instrumentation
+    def frontier(self):
+        instrumentation = self
+        class Frontier(deque):
+            def append(self, item):
+                start = time.perf_counter()
+                deque.append(self, item)
+                instrumentation.times['frontier'] += time.perf_counter() - start
+                instrumentation.pushed(len(self))
+
+            def popleft(self):
+                instrumentation.check_stale(instrumentation.maze.states_explored)
+                start = time.perf_counter()
+                item = deque.popleft(self)
+                instrumentation.times['frontier'] += time.perf_counter() - start
+                instrumentation.counts['pops'] += 1
+                return item
+        return Frontier
+
+    def stats(self):
+        return dict(self.counts, time = dict(self.times))
+
+    def to_json(self, path = None):
+        """Returns the metrics as a JSON string, also writing it to `path` if given"""
+        text = json.dumps(self.stats(), indent = 4)
+        if path is not None:
+            with open(path, 'w') as file:
+                file.write(text)
+        return text
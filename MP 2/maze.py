@@ -12,11 +12,11 @@ This file contains the Maze class, which reads in a maze file and creates
 a representation of the maze that is exposed through a simple interface.
 """
 
-import copy
+import struct
+import zlib
 import numpy as np
 from const import *
 from util import *
-from itertools import chain
 
 class MazeError(Exception):
     pass
@@ -27,38 +27,82 @@ class NoStartError(Exception):
 class NoObjectiveError(Exception):
     pass
 
+def encodeMap(input_map):
+    """Returns the uint8 occupancy array of an array_like of maze characters (or of cell codes)"""
+    chars = np.asarray(input_map)
+    if chars.dtype == np.uint8:
+        return chars
+    codes = np.full(chars.shape, UNKNOWN_CELL, dtype=np.uint8)
+    for code, char in enumerate(CELL_CHARS[:UNKNOWN_CELL]):
+        codes[chars == char] = code
+    if (codes == UNKNOWN_CELL).any():
+        raise MazeError('maze cells must be one of {0!r}'.format(CELL_CHARS[:UNKNOWN_CELL]))
+    return codes
+
+# binary maze files: magic, format version, compressed flag, then the number of levels, rows and
+# columns, followed by the cell codes in the order the ASCII format lists the characters
+BINARY_MAGIC = b'MP2MAZE\0'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<8sBB3I')
+# bytes handed to the compressor or file at a time
+BINARY_CHUNK = 1 << 20
+
+def isBinaryMaze(path):
+    """True if the file at path starts like a binary maze file"""
+    with open(path, 'rb') as file:
+        return file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
 class Maze:
-    def __init__(self, input_map, alien, granularity=DEFAULT_GRANULARITY, offsets=[0, 0, 0], filepath=None):
+    def __init__(self, input_map, alien, granularity=DEFAULT_GRANULARITY, offsets=[0, 0, 0], filepath=None, sweep=None):
         """Initialize the Maze class
 
         Args:
-            input_map (array_like): input maze map of shape (num_cols, num_rows, num_levels)
+            input_map (array_like): input maze map of shape (num_cols, num_rows, num_levels), of characters
+                or of cell codes (const.py), or a lazy map: a callable returning the code of cell (x, y, shape),
+                with `dimensions`, the `start` cell index and `candidates()`, the cell indices that may be
+                objectives. Cells of a lazy map are only classified, and then memoized, when first looked up.
             granularity (int): step size of the alien
             alien (Alien): the Alien instance
             offsets (list): list of offsets to make the maze start at (0,0,0) Ignore for this mp
-            filepath (str): file path to the ASCII maze
+            filepath (str): file path to the ASCII or binary maze
+            sweep (callable): continuous collision check, sweep(config1, config2) is True if the alien can
+                move between the two neighboring configurations without touching a wall. Moves it rejects
+                are left out of getNeighbors and make isValidPath fail, even between free cells.
         """        
         self.states_explored = 0
+        self.__lazy = False
+        self.__sweep = sweep
         if filepath:
             self.granularity = 0
-            self.readFromFile(filepath)
+            if isBinaryMaze(filepath):
+                self.readFromBinary(filepath)
+            else:
+                self.readFromFile(filepath)
             return
 
         self.__start = None
-        self.__objective = []        
         self.__alien = alien
         self.offsets = offsets
         self.granularity = granularity
         self.alien = alien
-        self.__dimensions = [len(input_map), len(input_map[0]),len(input_map[0][0])]      
-        self.__map = input_map
-        for x in range(self.__dimensions[X]):
-            for y in range(self.__dimensions[Y]):
-                for shape in range(self.__dimensions[SHAPE]):  
-                    if self.__map[x][y][shape] == START_CHAR:
-                        self.__start = idxToConfig((x, y,shape), self.offsets, granularity,self.__alien)
-                    elif self.__map[x][y][shape] == OBJECTIVE_CHAR:
-                        self.__objective.append(idxToConfig((x, y,shape), self.offsets, granularity,self.__alien))
+        self.__shapeIndex = {shape: k for k, shape in enumerate(alien.get_shapes())}
+        if callable(input_map):
+            self.__lazy = True
+            self.__classify = input_map
+            self.__map = np.full(input_map.dimensions, UNKNOWN_CELL, dtype=np.uint8)
+            self.__dimensions = list(input_map.dimensions)
+            self.__start = idxToConfig(input_map.start, self.offsets, granularity, self.__alien)
+            # found on first use by getObjectives
+            self.__objective = None
+            return
+
+        self.__map = encodeMap(input_map)
+        self.__dimensions = list(self.__map.shape)
+        starts = np.argwhere(self.__map == START_CELL).tolist()
+        if starts:
+            self.__start = idxToConfig(starts[-1], self.offsets, granularity, self.__alien)
+        self.__objective = tuple(idxToConfig(x, self.offsets, granularity, self.__alien)
+            for x in np.argwhere(self.__map == OBJECTIVE_CELL).tolist())
 
         if not self.__start:
             # raise SystemExit
@@ -71,9 +115,22 @@ class Maze:
         """Access data at index via self[index] instead of using self.__map"""
         i, j, k = index
         if 0 <= i < self.__dimensions[X] and 0 <= j < self.__dimensions[Y] and 0 <= k < self.__dimensions[SHAPE]:
-            return self.__map[i][j][k]
+            return CELL_CHARS[self.__code(i, j, k)]
         else:
             raise IndexError('cell index ({0}, {1}, {2}) out of range'.format(i, j, k))
+
+    def __code(self, i, j, k):
+        """Code of cell index (i, j, k), classifying it first in lazy mode"""
+        code = self.__map[i, j, k]
+        if code == UNKNOWN_CELL:
+            code = self.__map[i, j, k] = self.__classify(i, j, k)
+        return code
+
+    def __classifyAll(self):
+        """Classifies every cell of a lazy maze that has not been looked up yet"""
+        if self.__lazy:
+            for i, j, k in np.argwhere(self.__map == UNKNOWN_CELL).tolist():
+                self.__code(i, j, k)
     
     def readFromFile(self, path):
         """Construct a maze from file for Part 1
@@ -102,39 +159,54 @@ class Maze:
             raise MazeError('(maze \'{0}\'): all maze rows must be the same length (shortest row has length {1})'.format(path, m))
         
         
-        self.__map = np.transpose(levels, (1, 2, 0)).tolist()
+        self.__setMap(path, encodeMap(np.transpose(levels, (1, 2, 0))))
+
+    def readFromBinary(self, path):
+        """Construct a maze from a file written by saveToBinary, the same maze readFromFile gives for its ASCII file
+
+        Args:
+            path (string): file path
+        """
+        with open(path, 'rb') as file:
+            header = file.read(BINARY_HEADER.size)
+            if len(header) != BINARY_HEADER.size:
+                raise MazeError('(maze \'{0}\'): binary maze header is truncated'.format(path))
+            magic, version, compressed, h, n, m = BINARY_HEADER.unpack(header)
+            if magic != BINARY_MAGIC or version != BINARY_VERSION:
+                raise MazeError('(maze \'{0}\'): not a version {1} binary maze file'.format(path, BINARY_VERSION))
+            if compressed:
+                try:
+                    codes = np.frombuffer(bytearray(zlib.decompress(file.read())), dtype=np.uint8)
+                except zlib.error as error:
+                    raise MazeError('(maze \'{0}\'): binary maze cells are corrupt or truncated ({1})'.format(path, error))
+            else:
+                codes = np.fromfile(file, dtype=np.uint8, count=h * n * m)
+        if codes.size != h * n * m:
+            raise MazeError('(maze \'{0}\'): binary maze holds {1} cells, header promises {2}'.format(path, codes.size, h * n * m))
+        if codes.max(initial=0) >= UNKNOWN_CELL:
+            raise MazeError('maze cells must be one of {0!r}'.format(CELL_CHARS[:UNKNOWN_CELL]))
+        self.__setMap(path, codes.reshape(h, n, m).transpose(1, 2, 0))
+
+    def __setMap(self, path, codes):
+        """Stores the (num_rows, num_cols, num_levels) codes of the maze file at path, with its start and objectives"""
+        n, m, h = codes.shape
+        self.__map = codes
         self.__dimensions = [n, m, h]
 
-        if any(self[x] != WALL_CHAR for x in chain(
-            ((    0, j, k) for j in range(m) for k in range(h)), 
-            ((n - 1, j, k) for j in range(m) for k in range(h)), 
-            ((i,     0, k) for i in range(n) for k in range(h)), 
-            ((i, m - 1, k) for i in range(n) for k in range(h)))):
+        if not ((self.__map[[0, -1], :, :] == WALL_CELL).all() and (self.__map[:, [0, -1], :] == WALL_CELL).all()):
             raise MazeError('(maze \'{0}\'): maze borders must only contain `wall` cells (\'{1}\')'.format(path, WALL_CHAR))
         if n < 3 or m < 3:
             raise MazeError('(maze \'{0}\'): maze dimensions ({1}, {2}) must be at least (3, 3)'.format(path, n, m))
         
         # Checks if only 1 start, if so, stores index in self.__start
-        self.__start  = None 
-        for x in ((i, j, k) 
-            for i in range(n) 
-            for j in range(m) 
-            for k in range(h) if self[i, j, k] == START_CHAR):
-            if self.__start is None:
-                self.__start = x
-            elif type(self.__start) is int:
-                self.__start += 1 
-            else: 
-                self.__start  = 2
-        if type(self.__start) is int or self.__start is None:
+        starts = np.argwhere(self.__map == START_CELL).tolist()
+        if len(starts) != 1:
             raise MazeError('(maze \'{0}\'): maze must contain exactly one `start` cell (\'{1}\') (found {2})'.format(
-                path, START_CHAR, 0 if self.__start is None else self.__start))
+                path, START_CHAR, len(starts)))
+        self.__start = tuple(starts[0])
         
         # Stores waypoint indices in self.__objective
-        self.__objective = tuple((i, j, k) 
-            for i in range(n) 
-            for j in range(m) 
-            for k in range(h) if self[i, j, k] == OBJECTIVE_CHAR)
+        self.__objective = tuple(map(tuple, np.argwhere(self.__map == OBJECTIVE_CELL).tolist()))
 
     def getChar(self, x, y, shape, part1=False):
         """Getting underlying character at the specified coordinate
@@ -151,12 +223,16 @@ class Maze:
         if part1:
             i, j, k = x, y, shape
             return self[i, j, k]
-        oldx = x
-        oldy = y
-        oldshape = shape
-        x, y,shape = configToIdx((x,y,shape), self.offsets, self.granularity,self.alien)
-        print('getting char from {} {} {}, mapped to {} {} {} and is {}'.format(oldx,oldy,oldshape,x,y,shape,self.__map[x][y][shape]))
-        return self.__map[x][y][shape]
+        return CELL_CHARS[self.__code( * self.__index(x, y, shape))]
+
+    def __index(self, x, y, shape):
+        """configToIdx, with the shape index looked up in a dict instead of searching the shape list"""
+        return (int((x - self.offsets[X]) / self.granularity), int((y - self.offsets[Y]) / self.granularity), self.__shapeIndex[shape])
+
+    def __free(self, i, j, k):
+        """True if cell index (i, j, k) is inside the maze and not a wall"""
+        n, m, h = self.__dimensions
+        return 0 <= i < n and 0 <= j < m and 0 <= k < h and self.__code(i, j, k) != WALL_CELL
 
     # Returns True if the given position is the location of a wall
     def isWall(self, x, y, shape, ispart1=False):
@@ -177,12 +253,15 @@ class Maze:
     def getDimensions(self):
         return self.__dimensions
 
-    # Returns the list of objective positions of the maze
+    # Returns the objective positions of the maze, as a tuple that can be shared without copying
     def getObjectives(self):
-        return copy.deepcopy(self.__objective)
+        if self.__objective is None:
+            self.__objective = tuple(idxToConfig(x, self.offsets, self.granularity, self.__alien)
+                for x in self.__classify.candidates() if self.__code( * x ) == OBJECTIVE_CELL)
+        return self.__objective
 
     def setObjectives(self, objectives):
-        self.__objective = objectives
+        self.__objective = tuple(objectives)
 
     def isValidMove(self, x, y, shape, part1=False):
         """Check if the agent can move into a specific coordinate
@@ -202,12 +281,7 @@ class Maze:
                j >= 0 and j < self.getDimensions()[Y] and \
                0 <= k < self.getDimensions()[SHAPE] and not self.isWall(i, j, k, True)
 
-        old_x,old_y,old_shape = x,y,shape
-        x, y,shape = configToIdx((x,y,shape), self.offsets, self.granularity, self.alien)
-
-        return x >= 0 and x < self.getDimensions()[X] and \
-               y >= 0 and y < self.getDimensions()[Y] and \
-               0 <= shape < self.getDimensions()[SHAPE] and not self.isWall(old_x,old_y,old_shape)
+        return self.__free( * self.__index(x, y, shape))
         
     def getNeighbors(self, x, y, shape, part1=False):
         """Returns list of neighboing squares that can be moved to from the given coordinate
@@ -233,29 +307,22 @@ class Maze:
             (i, j, k + 1)) 
             if self.isValidMove( * x, True ))
 
-        possibleNeighbors = [
-            (x + self.granularity, y,shape),
-            (x - self.granularity, y,shape),
-            (x, y + self.granularity,shape),
-            (x, y - self.granularity,shape),
-            (x,y,self.alien.get_shapes().index(shape) -1),
-            (x,y,self.alien.get_shapes().index(shape) +1)            
-        ]
+        # neighbors are found by index arithmetic, in the order: x + 1, x - 1, y + 1, y - 1, shape - 1, shape + 1
+        shapes = self.alien.get_shapes()
+        i, j, k = self.__index(x, y, shape)
         neighbors = []
-        for a, b,c in possibleNeighbors:
-            if(type(c) == int):
-                if(0<= c < len(self.alien.get_shapes())):
-                    c = self.alien.get_shapes()[c]
-                    if(self.isValidMove(a,b,c)):
-                        neighbors.append((a,b,c))
-                else:
-                    continue
-            elif self.isValidMove(a,b,c):
-                neighbors.append((a,b,c))
+        for a, b in ((x + self.granularity, y), (x - self.granularity, y), (x, y + self.granularity), (x, y - self.granularity)):
+            if self.__free( * self.__index(a, b, shape)):
+                neighbors.append((a, b, shape))
+        for c in (k - 1, k + 1):
+            if 0 <= c < len(shapes) and self.__free(i, j, c):
+                neighbors.append((x, y, shapes[c]))
+        if self.__sweep is not None:
+            neighbors = [neighbor for neighbor in neighbors if self.__sweep((x, y, shape), neighbor)]
         return neighbors
 
     def saveToFile(self, filename): 
-        """Save the maze to file
+        """Save the maze to file, in the binary format if filename ends with BINARY_MAZE_SUFFIX
 
         Args:
             filename (string): file name
@@ -263,16 +330,44 @@ class Maze:
         Returns:
             bool: True if successfully saved
         """               
-        outputMap = ""
-        for shape in range(self.__dimensions[2]):
-            for y in range(self.__dimensions[1]):
-                for x in range(self.__dimensions[0]):
-                    outputMap += self.__map[x][y][shape]
-                outputMap += "\n"
-            outputMap += "#\n"
+        if filename.endswith(BINARY_MAZE_SUFFIX):
+            return self.saveToBinary(filename)
+        self.__classifyAll()
+        # characters of every level as rows of y, with a newline column appended
+        table = np.frombuffer((CELL_CHARS + '\n').encode(), dtype=np.uint8)
+        codes = np.full((self.__dimensions[SHAPE], self.__dimensions[Y], self.__dimensions[X] + 1), len(CELL_CHARS), dtype=np.uint8)
+        codes[:, :, :-1] = self.__map.transpose(2, 1, 0)
 
         with open(filename, 'w') as f:
-            f.write(outputMap)
+            for level in table[codes]:
+                f.write(level.tobytes().decode())
+                f.write("#\n")
+
+        return True
+
+    def saveToBinary(self, filename, compress=True):
+        """Save the maze to file in the binary format, streaming the cell codes out in chunks
+
+        Args:
+            filename (string): file name
+            compress (bool): zlib-compress the cell codes
+
+        Returns:
+            bool: True if successfully saved
+        """
+        self.__classifyAll()
+        # levels of rows of y, the order saveToFile writes the characters in
+        codes = np.ascontiguousarray(self.__map.transpose(2, 1, 0))
+        data = memoryview(codes).cast('B')
+        compressor = zlib.compressobj() if compress else None
+
+        with open(filename, 'wb') as f:
+            f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, compress, * codes.shape))
+            for start in range(0, len(data), BINARY_CHUNK):
+                chunk = data[start:start + BINARY_CHUNK]
+                f.write(compressor.compress(chunk) if compress else chunk)
+            if compress:
+                f.write(compressor.flush())
 
         return True
             
@@ -286,27 +381,51 @@ class Maze:
         Returns:
             string: detailed description on if the path is valid
         """        
-        # First, check whether it moves single hop
-        for i in range(1, len(path)):
-            prev = path[i-1]
-            cur = path[i]
-            dist = abs(prev[0]-cur[0]) + abs(prev[1]-cur[1]) #+ abs(prev[2] - cur[2])
-            if dist != self.granularity:
-                return "Not single hop"
-            if(abs(prev[2] - cur[2]) > 1):
-                return "Illegal Shape Transformation"
+        # Vertices are checked all at once as arrays instead of one configToIdx/getChar per vertex
+        shapes = {shape: k for k, shape in enumerate(self.alien.get_shapes())}
+        points = np.array([config[:2] for config in path], dtype=float).reshape(-1, 2)
+        levels = np.fromiter((shapes.get(config[2], -1) for config in path), dtype=int, count=len(path))
+        if (levels == -1).any():
+            return "Not valid move"
+
+        # First, check whether it moves single hop: one granularity step keeping the shape,
+        # or a change to a neighboring shape in place
+        moves = np.abs(np.diff(points, axis=0)).sum(axis=1)
+        shifts = np.abs(np.diff(levels))
+        hops = ((moves != self.granularity) | (shifts != 0)) & ((moves != 0) | (shifts == 0))
+        bad = np.flatnonzero(hops | (shifts > 1))
+        if bad.size:
+            return "Illegal Shape Transformation" if shifts[bad[0]] > 1 else "Not single hop"
 
         # Second, check whether it is valid move
-        for pos in path:
-            if not self.isValidMove(pos[0], pos[1],pos[2]):
-                return "Not valid move"
-
+        index = ((points - np.asarray(self.offsets[:2])) / self.granularity).astype(int)
+        dimensions = self.getDimensions()
+        inside = (0 <= index[:, X]) & (index[:, X] < dimensions[X]) & \
+                 (0 <= index[:, Y]) & (index[:, Y] < dimensions[Y]) & \
+                 (0 <= levels) & (levels < dimensions[SHAPE])
+        if not inside.all():
+            return "Not valid move"
+        if self.__lazy:
+            for cell in zip(index[:, X].tolist(), index[:, Y].tolist(), levels.tolist()):
+                self.__code( * cell )
+        if (self.__map[index[:, X], index[:, Y], levels] == WALL_CELL).any():
+            return "Not valid move"
+        if self.__sweep is not None and not all(self.__sweep(a, b) for a, b in zip(path, path[1:])):
+            return "Not valid move"
 
         # Last, check whether it ends up at one of goals
-        if not path[-1] in self.__objective:
+        if not path[-1] in self.getObjectives():
             return "Last position is not a goal state"
 
         return "Valid"
 
     def get_map(self):
-        return self.__map
+        """Returns the maze characters as a (num_cols, num_rows, num_levels) array"""
+        return np.array(list(CELL_CHARS))[self.get_codes()]
+
+    def get_codes(self):
+        """Returns a read-only view of the (num_cols, num_rows, num_levels) occupancy array of cell codes"""
+        self.__classifyAll()
+        codes = self.__map.view()
+        codes.flags.writeable = False
+        return codes
@@ -21,6 +21,8 @@ from pygame.locals import *
 from alien import Alien
 from transform import transformToMaze
 from search import search
+from instrument import Instrumentation
+import search as search_module
 from const import *
 from util import *
 from geometry import *
@@ -51,6 +53,7 @@ class Application:
 		self.obstacles = eval(self.config.get(map_name, 'Obstacles'))
 		boundary = [(0,0,0,lims[1]),(0,0,lims[0],0),(lims[0],0,lims[0],lims[1]),(0,lims[1],lims[0],lims[1])]
 		self.obstacles.extend(boundary)
+		self.wallGrid = WallGrid(self.obstacles)
 		self.goals = eval(self.config.get(map_name, 'Goals'))
 		self.alien_color = BLACK
 		self.alien = Alien(self.centroid,self.lengths,self.widths,self.alien_shapes,self.alien_shape,self.window)
@@ -67,14 +70,14 @@ class Application:
 		self.running = True
 
 	def get_alien_color(self):
-		if does_alien_touch_wall(self.alien, self.obstacles,self.granularity) or not is_alien_within_window(self.alien, self.window,self.granularity):
+		if does_alien_touch_wall(self.alien, self.wallGrid,self.granularity) or not is_alien_within_window(self.alien, self.window,self.granularity):
 			self.alien_color = RED
 		elif does_alien_touch_goal(self.alien,self.goals):
 			self.alien_color = GREEN
 		else: 
 			self.alien_color = BLACK
 	# Once the application is initiated, execute is in charge of drawing the game and dealing with the game loop
-	def execute(self, searchMethod, granularity, trajectory, saveMaze):    
+	def execute(self, searchMethod, granularity, trajectory, saveMaze, stats=None, processes=None, mazeCache=None, lazy=False, swept=False):    
 		self.granularity = granularity    
 		self.initialize()
 		if not self.running:
@@ -88,10 +91,15 @@ class Application:
 
 		if not self.__human:
 			print("Transforming a map configuration to a maze...")
-			maze = transformToMaze(self.alien, self.goals, self.obstacles, self.window, granularity)
+			maze = transformToMaze(self.alien, self.goals, self.obstacles, self.window, granularity, processes, cache=mazeCache, lazy=lazy, swept=swept)
 			print("Done!")
 			print("Searching the path...")
-			path = search(maze, searchMethod)
+			if stats is None:
+				path = search(maze, searchMethod)
+			else:
+				with Instrumentation(search_module, maze, memory=True) as instrumentation:
+					path = search(maze, searchMethod)
+				instrumentation.to_json(stats)
 			if path is None:
 				print("No path found!")
 			else:
@@ -241,7 +249,7 @@ if __name__ == "__main__":
 	parser.add_argument('--map', dest="map_name", type=str, default = "BasicMap",
 						help='configuration filename - default BasicMap')
 	parser.add_argument('--method', dest="search", type=str, default = "bfs", 
-						choices = ["bfs"],
+						choices = ["bfs", "astar", "astar_multi"],
 						help='search method - default bfs')
 	parser.add_argument('--human', default = False, action = "store_true",
 						help='flag for human playable - default False')
@@ -251,9 +259,19 @@ if __name__ == "__main__":
 						help='degree granularity - default '+str(DEFAULT_GRANULARITY))
 	parser.add_argument('--trajectory', dest="trajectory", type=int, default = 0, 
 						help='leave footprint of rotation trajectory in every x moves - default 0')
+	parser.add_argument('--stats', dest="stats", type=str, default = None, 
+						help='save search instrumentation (expansions, frontier, memory, timings) to json file - default not saved')
+	parser.add_argument('--processes', dest="processes", type=int, default = None, 
+						help='build the maze with this many worker processes - default build in the main process')
+	parser.add_argument('--maze-cache', dest="mazeCache", type=str, default = None, 
+						help='directory to reuse previously built mazes from - default always rebuild')
+	parser.add_argument('--lazy', default = False, action = "store_true",
+						help='only check the maze cells the search visits for collisions - default build the whole maze')
+	parser.add_argument('--swept', default = False, action = "store_true",
+						help='check the motion between cells for collisions too, so coarse granularities stay collision free - default check cells only')
 	parser.add_argument('--save-maze', dest="saveMaze", type=str, default = None, 
 						help='save the contructed maze to maze file - default not saved')
 	
 	args = parser.parse_args()
 	app = Application(args.configfile, args.map_name, args.human, args.fps)
-	app.execute(args.search, args.granularity, args.trajectory, args.saveMaze)
+	app.execute(args.search, args.granularity, args.trajectory, args.saveMaze, args.stats, args.processes, args.mazeCache, args.lazy, args.swept)
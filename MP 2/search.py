@@ -20,10 +20,13 @@ This file contains search functions.
 
 from collections import deque
 from heapq import heappop, heappush
+import numpy as np
 
 def search(maze, searchMethod):
     return {
         "bfs": bfs,
+        "astar": astar,
+        "astar_multi": astar_multi,
     }.get(searchMethod, [])(maze)
 
 class Node:
@@ -72,4 +75,144 @@ def bfs(maze, ispart1=False):
             if neighbor not in visited or visited[neighbor] > curr.cost + 1:
                 visited[neighbor] = curr.cost + 1
                 queue.append(Node(neighbor, curr, curr.cost + 1))
-    return None
\ No newline at end of file
+    return None
+
+def shape_levels(maze, ispart1=False):
+    """Returns a dict from shape to level index, the identity for part 1 where shapes already are indices"""
+    if ispart1:
+        return {k: k for k in range(maze.getDimensions()[2])}
+    return {shape: k for k, shape in enumerate(maze.alien.get_shapes())}
+
+def goal_table(objectives, levels, dimensions, step, offsets, shape_cost=1):
+    """
+    Returns, as an array indexed [i, j, level] like the maze cells, the admissible estimate of the
+    cost from every cell to the nearest of `objectives`: the Manhattan distance in moves of size `step`,
+    plus `shape_cost` per shape level to change. The estimate is a weighted Manhattan distance transform,
+    which is separable, so it is built once with a forward and a backward sweep along each axis.
+    """
+    table = np.full(dimensions, np.inf)
+    for x, y, shape in objectives:
+        table[int((x - offsets[0]) / step), int((y - offsets[1]) / step), levels[shape]] = 0
+    for axis, cost in ((0, 1), (1, 1), (2, shape_cost)):
+        lines = np.moveaxis(table, axis, 0)
+        for n in range(1, len(lines)):
+            np.minimum(lines[n], lines[n - 1] + cost, out=lines[n])
+        for n in range(len(lines) - 2, -1, -1):
+            np.minimum(lines[n], lines[n + 1] + cost, out=lines[n])
+    return table
+
+def heuristic(x, y, level, table, step, offsets):
+    """Looks up the goal_table estimate of configuration (x, y, level)"""
+    return table[int((x - offsets[0]) / step), int((y - offsets[1]) / step), level]
+
+def goal_regions(objectives, step, levels):
+    """Groups objective configurations into connected regions, one per goal area reached, in order of first objective"""
+    shapes = {k: shape for shape, k in levels.items()}
+    region = {}
+    for first in objectives:
+        if first in region:
+            continue
+        region[first] = len(set(region.values()))
+        stack = [first]
+        while stack:
+            x, y, shape = stack.pop()
+            level = levels[shape]
+            for config in ((x + step, y, shape), (x - step, y, shape), (x, y + step, shape), (x, y - step, shape),
+                    (x, y, shapes.get(level - 1)), (x, y, shapes.get(level + 1))):
+                if config in objectives and config not in region:
+                    region[config] = region[first]
+                    stack.append(config)
+    return region
+
+def trace_path(parents, state, config = lambda state: state):
+    path = []
+    while state is not None:
+        path.append(config(state))
+        state = parents[state]
+    path.reverse()
+    return path
+
+def astar(maze, ispart1=False, shape_cost=1):
+    """
+    This function returns optimal path in a list, which contains start and objective.
+    If no path found, return None. A move costs 1 and a shape change `shape_cost`,
+    and the search is guided towards the nearest objective.
+
+    Args:
+        maze: Maze instance from maze.py
+        ispart1: pass this variable when you use functions such as getNeighbors and isObjective. DO NOT MODIFY THIS
+        shape_cost: cost of changing shape, relative to moving one step
+    """
+    levels = shape_levels(maze, ispart1)
+    step = 1 if ispart1 else maze.granularity
+    offsets = (0, 0) if ispart1 else maze.offsets
+    table = goal_table(maze.getObjectives(), levels, maze.getDimensions(), step, offsets, shape_cost)
+    start = maze.getStart()
+    costs = {start: 0}
+    parents = {start: None}
+
+    heap = [(heuristic(start[0], start[1], levels[start[2]], table, step, offsets), 0, start)]
+    while heap:
+        _, cost, curr = heappop(heap)
+        # a cheaper route to this configuration was pushed after this entry
+        if cost > costs[curr]:
+            continue
+        if maze.isObjective(curr[0], curr[1], curr[2], ispart1):
+            return trace_path(parents, curr)
+
+        for neighbor in maze.getNeighbors(curr[0], curr[1], curr[2], ispart1):
+            neighborCost = cost + (shape_cost if neighbor[2] != curr[2] else 1)
+            if neighbor not in costs or neighborCost < costs[neighbor]:
+                costs[neighbor] = neighborCost
+                parents[neighbor] = curr
+                heappush(heap, (neighborCost + heuristic(neighbor[0], neighbor[1], levels[neighbor[2]], table, step, offsets), neighborCost, neighbor))
+    return None
+
+def astar_multi(maze, ispart1=False, shape_cost=1):
+    """
+    This function returns the optimal path in a list that reaches every goal area, i.e. every
+    connected region of objectives, starting from start and ending at an objective.
+    If no path found, return None. Costs are as in astar, and the estimate is the largest
+    over the unreached regions of the estimate to that region's nearest objective.
+
+    Args:
+        maze: Maze instance from maze.py
+        ispart1: pass this variable when you use functions such as getNeighbors and isObjective. DO NOT MODIFY THIS
+        shape_cost: cost of changing shape, relative to moving one step
+    """
+    levels = shape_levels(maze, ispart1)
+    step = 1 if ispart1 else maze.granularity
+    offsets = (0, 0) if ispart1 else maze.offsets
+    objectives = set(maze.getObjectives())
+    region = goal_regions(objectives, step, levels)
+    count = len(set(region.values()))
+    tables = [goal_table([config for config in objectives if region[config] == r], levels, maze.getDimensions(), step, offsets, shape_cost)
+        for r in range(count)]
+    done = (1 << count) - 1
+
+    def estimate(config, mask):
+        return max((heuristic(config[0], config[1], levels[config[2]], tables[r], step, offsets)
+            for r in range(count) if not mask >> r & 1), default = 0)
+
+    # a state is a configuration and the mask of regions reached so far
+    start = (maze.getStart(), 0)
+    costs = {start: 0}
+    parents = {start: None}
+
+    heap = [(estimate( * start ), 0, start)]
+    while heap:
+        _, cost, state = heappop(heap)
+        if cost > costs[state]:
+            continue
+        curr, mask = state
+        if mask == done:
+            return trace_path(parents, state, lambda state: state[0])
+
+        for neighbor in maze.getNeighbors(curr[0], curr[1], curr[2], ispart1):
+            neighborState = (neighbor, mask | 1 << region[neighbor] if neighbor in region else mask)
+            neighborCost = cost + (shape_cost if neighbor[2] != curr[2] else 1)
+            if neighborState not in costs or neighborCost < costs[neighborState]:
+                costs[neighborState] = neighborCost
+                parents[neighborState] = state
+                heappush(heap, (neighborCost + estimate( * neighborState ), neighborCost, neighborState))
+    return None
@@ -20,15 +20,37 @@ from geometry import *
 from const import *
 from util import *
 import os
+import math
+import sys
+import hashlib
+import numpy as np
+import geometry
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 
-def transformToMaze(alien, goals, walls, window,granularity):
+def transformToMaze(alien, goals, walls, window,granularity, processes=None, tile=None, cache=None, lazy=False, swept=False):
     """This function transforms the given 2D map to the maze in MP1.
+
+        Every shape level is built in one batch: the collision tests of
+        geometry.py are evaluated with NumPy for all grid centroids against
+        all walls, goals and window edges at once. Levels can be split into
+        `tile` x `tile` blocks of cells, and with `processes` the blocks are
+        spread over a process pool that writes into shared memory.
     
         Args:
             alien (Alien): alien instance
             goals (list): [(x, y, r)] of goals
             walls (list): [(startx, starty, endx, endy)] of walls
             window (tuple): (width, height) of the window
+            processes (int): number of worker processes, None to build in this process
+            tile (int): side length in cells of the blocks the levels are built in, None for whole levels.
+                Each block only tests the walls a WallGrid finds near it.
+            cache (str): directory of previously built mazes, consulted first and updated after a build
+            lazy (bool): skip the build and return a maze whose cells are only checked for collisions
+                when a search first looks at them
+            swept (bool): check cells without the granularity tolerance, and every move between
+                neighboring cells with does_alien_sweep_touch_wall as the search makes it, so paths
+                are collision free between grid samples too and coarse granularities stay safe
 
         Return:
             Maze: the maze instance generated based on input arguments.
@@ -37,41 +59,211 @@ def transformToMaze(alien, goals, walls, window,granularity):
     offsets = [0,0,0]
     mazeWidth = int(window[0]/granularity) + 1
     mazeHeight = int(window[1]/granularity) + 1
-    mazeInstance = [[['' for k in range(3)] for j in range(mazeHeight)] for i in range(mazeWidth)]
     startConfig = (alien.get_centroid()[0], alien.get_centroid()[1], alien.get_shape())
     startIdx = configToIdx(alien.get_config(), [0,0,0], granularity, alien)
 
-    #for every value in the condensed maze, parse
-    for i in range(mazeWidth):
-        for j in range(mazeHeight):
-            #set default index that starts at horizontal and create a config from that index to set alien to
-            idx = (i, j, 0)
-            currConfig = idxToConfig(idx, offsets, granularity, alien)
-            alien.set_alien_config(currConfig)
-
-            #check every level at coordinate (i, j) in order to set the correct character based on collisions
-            setShapeLevel(mazeInstance, alien, walls, window, granularity, goals)
-            alien.set_alien_shape('Ball')
-            setShapeLevel(mazeInstance, alien, walls, window, granularity, goals)
-            alien.set_alien_shape('Vertical')
-            setShapeLevel(mazeInstance, alien, walls, window, granularity, goals)
+    sweep = SweptMotion(alien, walls, window) if swept else None
+
+    if lazy:
+        return Maze(LazyMap(alien, goals, walls, window, granularity, startIdx, swept), alien, granularity, offsets, sweep=sweep)
+
+    shape = (mazeWidth, mazeHeight, len(alien.get_shapes()))
+    cachePath = os.path.join(cache, mazeKey(alien, goals, walls, window, granularity, swept) + '.npy') if cache else None
+    mazeInstance = loadCachedMaze(cachePath, shape) if cachePath else None
+    if mazeInstance is None:
+        mazeInstance = buildLevels(shape, alien, goals, walls, window, granularity, processes, tile, swept)
+        if cachePath:
+            saveCachedMaze(cachePath, mazeInstance)
 
     alien.set_alien_config(startConfig)
-    mazeInstance[startIdx[0]][startIdx[1]][startIdx[2]] = 'P'
+    mazeInstance[startIdx[0], startIdx[1], startIdx[2]] = START_CELL
 
-    retMaze = Maze(mazeInstance, alien, granularity, offsets)
+    retMaze = Maze(mazeInstance, alien, granularity, offsets, sweep=sweep)
     return retMaze  
-    
-# helper function to set the correct maze value for current alien level
-def setShapeLevel(mazeInstance, alien, walls, window, granularity, goals):
-    idx = configToIdx(alien.get_config(), [0,0,0], granularity, alien)
-    if does_alien_touch_wall(alien, walls, granularity) or not is_alien_within_window(alien, window, granularity):
-        mazeInstance[idx[0]][idx[1]][idx[2]] = '%'
-    elif does_alien_touch_goal(alien, goals):
-        mazeInstance[idx[0]][idx[1]][idx[2]] = '.'
+
+class LazyMap:
+    """Classifies maze cells one at a time with the geometry.py collision tests, for the lazy mode of Maze"""
+    def __init__(self, alien, goals, walls, window, granularity, start, swept=False):
+        # a private alien, so classifying cells never moves the caller's
+        self.alien = copy.copy(alien)
+        self.goals = goals
+        self.walls = WallGrid(walls)
+        self.window = window
+        self.granularity = granularity
+        # granularity the collision tests take their tolerance from, none for swept mazes
+        self.tolerance = 0 if swept else granularity
+        self.start = tuple(start)
+        self.dimensions = (int(window[0]/granularity) + 1, int(window[1]/granularity) + 1, len(alien.get_shapes()))
+
+        #farthest any shape's body reaches from its centroid, to bound where goals can be touched
+        self.reach = 0
+        for shape in alien.get_shapes():
+            self.alien.set_alien_config((0, 0, shape))
+            self.reach = max(self.reach, self.alien.get_width() + self.alien.get_length()/2)
+
+    def __call__(self, i, j, k):
+        if (i, j, k) == self.start:
+            return START_CELL
+        self.alien.set_alien_config(idxToConfig((i, j, k), [0,0,0], self.granularity, self.alien))
+        if does_alien_touch_wall(self.alien, self.walls, self.tolerance) or not is_alien_within_window(self.alien, self.window, self.tolerance):
+            return WALL_CELL
+        elif does_alien_touch_goal(self.alien, self.goals):
+            return OBJECTIVE_CELL
+        return SPACE_CELL
+
+    def candidates(self):
+        """Returns, in index order, the cells whose centroid is close enough to a goal to touch it"""
+        cells = set()
+        for x, y, r in self.goals:
+            reach = r + self.reach
+            i0, i1 = max(0, math.floor((x - reach)/self.granularity) - 1), min(self.dimensions[X] - 1, math.ceil((x + reach)/self.granularity) + 1)
+            j0, j1 = max(0, math.floor((y - reach)/self.granularity) - 1), min(self.dimensions[Y] - 1, math.ceil((y + reach)/self.granularity) + 1)
+            cells.update((i, j, k) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1) for k in range(self.dimensions[SHAPE]))
+        return sorted(cells)
+
+class SweptMotion:
+    """Continuous collision check of the moves between neighboring cells, for the sweep of Maze"""
+    def __init__(self, alien, walls, window):
+        # a private alien, so checking moves never moves the caller's
+        self.alien = copy.copy(alien)
+        self.walls = WallGrid(list(walls) + windowWalls(window))
+        # moves are symmetric, so each is checked once whichever way it is made
+        self.checked = {}
+
+    def __call__(self, config1, config2):
+        """True if the alien can move from config1 to config2 without touching a wall or the window edges"""
+        move = tuple(sorted((tuple(config1), tuple(config2))))
+        free = self.checked.get(move)
+        if free is None:
+            free = self.checked[move] = not does_alien_sweep_touch_wall(self.alien, config1, config2, self.walls)
+        return free
+
+# builds the maze cell codes of every shape level, without the start
+def buildLevels(shape, alien, goals, walls, window, granularity, processes, tile, swept=False):
+    mazeWidth, mazeHeight = shape[X], shape[Y]
+    width, height = tile or mazeWidth, tile or mazeHeight
+    tasks = [(level, i, min(i + width, mazeWidth), j, min(j + height, mazeHeight))
+        for level in range(shape[SHAPE]) for i in range(0, mazeWidth, width) for j in range(0, mazeHeight, height)]
+    if tile:
+        walls = WallGrid(walls)
+    if processes is None:
+        mazeInstance = np.empty(shape, dtype=np.uint8)
+        for task in tasks:
+            fillTile(mazeInstance, alien, * task, walls, window, granularity, goals, swept)
+    else:
+        mazeInstance = parallelLevels(shape, tasks, alien, walls, window, granularity, goals, processes, swept)
+    return mazeInstance
+
+# hash of everything a built maze depends on: the map, the alien's body in every shape, the
+# granularity, whether cells are checked for a swept maze, and the source of the collision tests,
+# so edits to them invalidate the cache
+def mazeKey(alien, goals, walls, window, granularity, swept=False):
+    config = alien.get_config()
+    body = []
+    for shape in alien.get_shapes():
+        alien.set_alien_config((0, 0, shape))
+        body.append((shape, alien.get_length(), alien.get_width()))
+    alien.set_alien_config(config)
+
+    key = hashlib.sha256(repr((tuple(window), [tuple(wall) for wall in walls], [tuple(goal) for goal in goals], body, granularity, swept)).encode())
+    for module in (geometry, sys.modules[__name__]):
+        with open(module.__file__, 'rb') as file:
+            key.update(file.read())
+    return key.hexdigest()
+
+# returns the cached maze cell codes at path, or None if missing or not of the expected shape and type
+def loadCachedMaze(path, shape):
+    try:
+        mazeInstance = np.load(path)
+    except (OSError, ValueError):
+        return None
+    if mazeInstance.shape != shape or mazeInstance.dtype != np.uint8:
+        return None
+    return mazeInstance
+
+# stores the maze cell codes, renaming into place so readers never see a partial file
+def saveCachedMaze(path, mazeInstance):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary, 'wb') as file:
+        np.save(file, mazeInstance)
+    os.replace(temporary, path)
+
+# computes the cell codes of cells [i0, i1) x [j0, j1) of one shape level into mazeInstance,
+# without the granularity tolerance if swept
+def fillTile(mazeInstance, alien, level, i0, i1, j0, j1, walls, window, granularity, goals, swept=False):
+    #centroids of the cells, as idxToConfig computes them
+    x, y = np.meshgrid(np.arange(i0, i1) * granularity, np.arange(j0, j1) * granularity, indexing='ij')
+    mazeInstance[i0:i1, j0:j1, level] = shapeLevel(alien, alien.get_shapes()[level], x.astype(float), y.astype(float), walls, window, 0 if swept else granularity, goals)
+
+# per-worker arguments shared by every tile, set once by the pool initializer
+WORKER = {}
+
+def initWorker(name, shape, alien, walls, window, granularity, goals, swept):
+    block = shared_memory.SharedMemory(name=name)
+    WORKER.update(block=block, maze=np.ndarray(shape, dtype=np.uint8, buffer=block.buf),
+        alien=alien, walls=walls, window=window, granularity=granularity, goals=goals, swept=swept)
+
+# worker side of parallelLevels: fills one tile of the maze held in shared memory
+def fillSharedTile(level, i0, i1, j0, j1):
+    fillTile(WORKER['maze'], WORKER['alien'], level, i0, i1, j0, j1, WORKER['walls'], WORKER['window'], WORKER['granularity'], WORKER['goals'], WORKER['swept'])
+
+# builds the maze cell codes of (level, i0, i1, j0, j1) tasks in a process pool, returning a private copy
+def parallelLevels(shape, tasks, alien, walls, window, granularity, goals, processes, swept=False):
+    block = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    try:
+        with ProcessPoolExecutor(processes, initializer=initWorker,
+                initargs=(block.name, shape, alien, walls, window, granularity, goals, swept)) as executor:
+            for _ in executor.map(fillSharedTile, * zip( * tasks )):
+                pass
+        return np.ndarray(shape, dtype=np.uint8, buffer=block.buf).copy()
+    finally:
+        block.close()
+        block.unlink()
+
+def windowWalls(window):
+    return [(0, 0, window[0], 0), (0, 0, 0, window[1]), (window[0], 0, window[0], window[1]), (0, window[1], window[0], window[1])]
+
+# helper function to get the maze cell codes of one alien shape at every centroid (x, y)
+def shapeLevel(alien, shape, x, y, walls, window, granularity, goals):
+    tolerance = granularity/math.sqrt(2)
+    #read the shape's radius and head/tail offsets off an alien placed at the origin
+    alien.set_alien_config((0, 0, shape))
+    width = alien.get_width()
+    (headX, headY), (tailX, tailY) = alien.get_head_and_tail()
+    if alien.is_circle():
+        body = (x, y)
     else:
-        mazeInstance[idx[0]][idx[1]][idx[2]] = ' '
+        body = (x + headX, y + headY, x + tailX, y + tailY)
+    if isinstance(walls, WallGrid):
+        walls = walls.around(min(np.min(part) for part in body[0::2]), min(np.min(part) for part in body[1::2]),
+            max(np.max(part) for part in body[0::2]), max(np.max(part) for part in body[1::2]), width + tolerance)
+
+    touchWall = bodyTouches(body, walls, width + tolerance) | bodyTouches(body, windowWalls(window), width + tolerance)
+    touchGoal = np.zeros(x.shape, dtype=bool)
+    for goal in goals:
+        if alien.is_circle():
+            distance = np.sqrt((goal[0] - x)**2 + (goal[1] - y)**2)
+        else:
+            distance = segmentDist( * body, goal[0], goal[1])
+        touchGoal |= (distance < width + goal[2]) | np.isclose(distance, width + goal[2])
+    return np.where(touchWall, WALL_CELL, np.where(touchGoal, OBJECTIVE_CELL, SPACE_CELL)).astype(np.uint8)
 
+# whether a ball (x, y) or oblong (headx, heady, tailx, taily) body, given as arrays, comes within radius of any wall
+def bodyTouches(body, walls, radius):
+    touched = np.zeros(body[0].shape, dtype=bool)
+    for wall in walls:
+        if len(body) == 2:
+            minDist = segmentDist( * wall, * body)
+        else:
+            minDist = np.minimum.reduce([
+                segmentDist( * wall, body[0], body[1]),
+                segmentDist( * wall, body[2], body[3]),
+                segmentDist( * body, wall[0], wall[1]),
+                segmentDist( * body, wall[2], wall[3])])
+            touched |= segmentsIntersect( * body, * wall)
+        touched |= (minDist < radius) | np.isclose(minDist, radius)
+    return touched
 
 if __name__ == '__main__':
     import configparser
@@ -98,7 +290,7 @@ if __name__ == '__main__':
                     obstacles.extend(boundary)
                     goals = eval(config.get(map_name, 'Goals'))
                     alien = Alien(centroid,lengths,widths,alien_shapes,alien_shape,window)
-                    generated_maze = transformToMaze(alien,goals,obstacles,window,granularity)
+                    generated_maze = transformToMaze(alien,goals,obstacles,window,granularity,cache='./mazes/cache')
                     generated_maze.saveToFile('./mazes/{}_granularity_{}.txt'.format(map_name,granularity))
                 except Exception as e:
                     print('Exception at maze {} and granularity {}: {}'.format(map_name,granularity,e))
@@ -114,8 +306,8 @@ if __name__ == '__main__':
                     continue
                 gt_maze = Maze([],[],[],filepath = gt_maze_file)
                 this_maze = Maze([],[],[],filepath= this_maze_file)
-                gt_map = np.array(gt_maze.get_map())
-                this_map = np.array(this_maze.get_map())
+                gt_map = gt_maze.get_map()
+                this_map = this_maze.get_map()
                 difx,dify,difz = np.where(gt_map != this_map)
                 if(difx.size != 0):
                     diff_dict = {}